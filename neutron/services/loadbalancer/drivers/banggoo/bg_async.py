@@ -0,0 +1,76 @@
+import collections
+import threading
+
+import eventlet
+
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class OrderedWorkerPool(object):
+
+    """Bounded pool of workers that keeps per-object ordering.
+
+    Tasks are submitted under a key (the id of the object they operate on)
+    and run in submission order for that key, while tasks of unrelated keys
+    run concurrently on at most ``size`` green threads. A task may name a
+    ``parent`` key: if the parent still has queued work, the task joins the
+    parent's lane so that e.g. a member create cannot overtake the create of
+    its pool.
+    """
+
+    def __init__(self, size):
+        self._pool = eventlet.GreenPool(size)
+        self._lock = threading.Lock()
+        # lane -> deque of (key, func, args, kwargs)
+        self._lanes = {}
+        # key -> lane its pending tasks are queued on
+        self._lane_of = {}
+
+    def submit(self, key, func, *args, **kwargs):
+        """Queue ``func(*args, **kwargs)`` behind earlier tasks of ``key``."""
+        parent = kwargs.pop('parent', None)
+        with self._lock:
+            lane = self._lane_of.get(key)
+            if lane is None and parent is not None:
+                lane = self._lane_of.get(parent)
+            if lane is None:
+                lane = key
+            self._lane_of[key] = lane
+            tasks = self._lanes.get(lane)
+            start = tasks is None
+            if start:
+                tasks = self._lanes[lane] = collections.deque()
+            tasks.append((key, func, args, kwargs))
+        if start:
+            # blocks while every worker is busy, which bounds the backlog
+            self._pool.spawn_n(self._run_lane, lane)
+
+    def pending(self):
+        """Return the number of queued and running tasks."""
+        with self._lock:
+            return sum(len(tasks) for tasks in self._lanes.values())
+
+    def waitall(self):
+        """Wait until every submitted task has finished."""
+        self._pool.waitall()
+
+    def _run_lane(self, lane):
+        while True:
+            with self._lock:
+                key, func, args, kwargs = self._lanes[lane][0]
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                LOG.exception(_("Banggoo background operation on %s failed"),
+                              key)
+            with self._lock:
+                tasks = self._lanes[lane]
+                tasks.popleft()
+                if not any(k == key for k, _f, _a, _kw in tasks):
+                    if self._lane_of.get(key) == lane:
+                        del self._lane_of[key]
+                if not tasks:
+                    del self._lanes[lane]
+                    return
@@ -0,0 +1,71 @@
+import threading
+
+import eventlet
+from eventlet import event
+
+
+class _Entry(object):
+
+    def __init__(self, item_id, item):
+        self.item_id = item_id
+        self.item = item
+        self.done = event.Event()
+
+
+class OperationBatcher(object):
+
+    """Coalesces operations that arrive close together into one request.
+
+    Callers submit items under a batch key (e.g. tenant and operation). The
+    first caller of a batch waits ``window`` seconds for others to join, or
+    the batch is sent as soon as it holds ``max_size`` items. ``flush`` is
+    called with the key and a list of (item_id, item) pairs and returns a
+    dict of item_id -> exception for the items that failed. Every caller
+    blocks until its own item is done and gets its own outcome back.
+    """
+
+    def __init__(self, flush, window, max_size):
+        self._flush = flush
+        self.window = window
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._batches = {}
+
+    def submit(self, key, item_id, item):
+        """Add an item to the current batch of key and wait for its result.
+
+        Raises the exception reported for the item, if any.
+        """
+        entry = _Entry(item_id, item)
+        with self._lock:
+            batch = self._batches.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._batches[key] = []
+            batch.append(entry)
+            full = len(batch) >= self.max_size
+            if full:
+                del self._batches[key]
+        if full:
+            self._run(key, batch)
+        elif leader:
+            eventlet.sleep(self.window)
+            with self._lock:
+                if self._batches.get(key) is batch:
+                    del self._batches[key]
+                else:
+                    # already sent by the caller that filled it up
+                    batch = None
+            if batch:
+                self._run(key, batch)
+        error = entry.done.wait()
+        if error is not None:
+            raise error
+
+    def _run(self, key, batch):
+        try:
+            errors = self._flush(key, [(e.item_id, e.item) for e in batch])
+        except Exception as e:
+            errors = dict((entry.item_id, e) for entry in batch)
+        for entry in batch:
+            entry.done.send(errors.get(entry.item_id))
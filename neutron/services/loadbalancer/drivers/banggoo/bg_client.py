@@ -13,22 +13,63 @@
 #    under the License.
 
 import base64
+import logging as std_logging
+import random
+import threading
+import time
+import zlib
+
 import requests
+from requests import adapters
 
 from neutron.common import exceptions as n_exc
 from neutron.openstack.common import jsonutils
 from neutron.openstack.common import log as logging
+from neutron.services.loadbalancer.drivers.banggoo import bg_metrics
+from neutron.services.loadbalancer.drivers.banggoo import bg_stream
+from neutron.services.loadbalancer.drivers.banggoo import bg_trace
 
 LOG = logging.getLogger(__name__)
 
 CONTENT_TYPE_HEADER = 'Content-type'
 ACCEPT_HEADER = 'Accept'
 AUTH_HEADER = 'Authorization'
+TOKEN_HEADER = 'X-Auth-Token'
 DRIVER_HEADER = 'X-OpenStack-LBaaS'
 TENANT_HEADER = 'X-Tenant-ID'
+IDEMPOTENCY_HEADER = 'X-Idempotency-Key'
+ENCODING_HEADER = 'Content-Encoding'
+ACCEPT_ENCODING_HEADER = 'Accept-Encoding'
 JSON_CONTENT_TYPE = 'application/json'
 DRIVER_HEADER_VALUE = 'netscaler-openstack-lbaas'
 
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_POOL_IDLE_TIMEOUT = 60
+
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 60.0
+IDEMPOTENT_METHODS = ('GET', 'PUT', 'DELETE')
+MAX_RETRY_BACKOFF = 10.0
+
+AUTH_BASIC = 'basic'
+AUTH_TOKEN = 'token'
+LOGIN_RESOURCE = 'login'
+DEFAULT_TOKEN_LIFETIME = 3600
+DEFAULT_TOKEN_REFRESH_MARGIN = 60
+
+COMPRESSION_NONE = 'none'
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_DEFLATE = 'deflate'
+COMPRESSIONS = (COMPRESSION_NONE, COMPRESSION_GZIP, COMPRESSION_DEFLATE)
+# smallest request body worth compressing, in bytes
+DEFAULT_COMPRESSION_THRESHOLD = 1024
+
+# characters of a response body written to the debug log
+DEBUG_BODY_LIMIT = 1024
+# bytes read at a time from a streamed response
+STREAM_CHUNK_SIZE = 64 * 1024
+
 
 class BGException(n_exc.NeutronException):
 
@@ -39,17 +80,245 @@ class BGException(n_exc.NeutronException):
     RESPONSE_ERROR = 3
     UNKNOWN_ERROR = 4
 
-    def __init__(self, error):
+    def __init__(self, error, status=None):
         self.message = _("Banggoo Error %d") % error
         super(BGException, self).__init__()
         self.error = error
+        # HTTP status of the failed response, if there was one
+        self.status = status
+
+
+class CircuitBreaker(object):
+
+    """Fails calls fast while an endpoint keeps failing.
+
+    After ``threshold`` consecutive failures the breaker opens and refuses
+    calls for ``reset_timeout`` seconds. It then lets a single probe
+    through: success closes the breaker, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return whether a call may be attempted now."""
+        if not self.threshold:
+            return True
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if (self.state == self.OPEN and
+                    time.time() - self._opened_at >= self.reset_timeout):
+                self.state = self.HALF_OPEN
+                return True
+            # open, or half-open with the probe still in flight
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        if not self.threshold:
+            return
+        with self._lock:
+            self.failures += 1
+            if (self.state == self.HALF_OPEN or
+                    self.failures >= self.threshold):
+                self.state = self.OPEN
+                self._opened_at = time.time()
+
+
+class TokenAuth(object):
+
+    """Session token of a Control Center, shared by all threads.
+
+    The first request logs in with a POST to ``login``; the token is then
+    reused until ``refresh_margin`` seconds before it expires. From then on
+    a single caller renews it while the others keep using the old one, so
+    renewals never stall traffic. The device is expected to answer the
+    login with ``{"login": {"token": ..., "expires_in": <seconds>}}``.
+    """
+
+    def __init__(self, client, username, password,
+                 refresh_margin=DEFAULT_TOKEN_REFRESH_MARGIN,
+                 lifetime=DEFAULT_TOKEN_LIFETIME):
+        self.client = client
+        self.username = username
+        self.password = password
+        self.refresh_margin = refresh_margin
+        self.lifetime = lifetime
+        self._token = None
+        self._expires = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return a valid token, logging in if needed."""
+        now = time.time()
+        token = self._token
+        if token and now < self._expires - self.refresh_margin:
+            return token
+        if token and now < self._expires:
+            if not self._lock.acquire(False):
+                # another thread is renewing it
+                return token
+        else:
+            self._lock.acquire()
+        try:
+            if self._token and time.time() < (self._expires -
+                                              self.refresh_margin):
+                return self._token
+            try:
+                self._login()
+            except BGException:
+                if token and time.time() < self._expires:
+                    LOG.warn(_("Renewing the token of %s failed, using the "
+                               "current one"), self.client.service_uri)
+                    return token
+                raise
+            return self._token
+        finally:
+            self._lock.release()
+
+    def invalidate(self, token):
+        """Drop token after the device rejected it."""
+        if self._token == token:
+            self._token = None
+            self._expires = 0
+
+    def _login(self):
+        headers = {ACCEPT_HEADER: JSON_CONTENT_TYPE,
+                   CONTENT_TYPE_HEADER: JSON_CONTENT_TYPE,
+                   DRIVER_HEADER: DRIVER_HEADER_VALUE}
+        body = jsonutils.dumps({LOGIN_RESOURCE: {'username': self.username,
+                                                 'password': self.password}})
+        started = time.time()
+        resp_dict = self.client._send_request(
+            'POST', "%s/%s" % (self.client.service_uri, LOGIN_RESOURCE),
+            headers, body)[1]
+        login = (resp_dict.get('dict') or {}).get(LOGIN_RESOURCE) or {}
+        if not login.get('token'):
+            LOG.error(_("Login to %s returned no token"),
+                      self.client.service_uri)
+            raise BGException(BGException.RESPONSE_ERROR)
+        self._token = login['token']
+        self._expires = started + float(login.get('expires_in') or
+                                        self.lifetime)
+        LOG.debug(_("Logged in to %s"), self.client.service_uri)
+
+
+class LazyResponse(object):
+
+    """Response of the Control Center, decoded only when asked for.
+
+    Read like the dict it replaces: 'status' and 'headers' are always
+    there, while 'body' (the text) and 'dict' (the JSON of a successful
+    response) are decoded from the raw bytes on first access. items()
+    walks a large collection without decoding it as a whole; for a
+    streamed response it must be consumed to release the connection.
+    """
+
+    def __init__(self, response, streamed=False, metrics=None):
+        self.response = response
+        self.streamed = streamed
+        self.metrics = metrics
+        self._dict = None
+
+    def __getitem__(self, key):
+        response = self.response
+        if key == 'status':
+            return response.status_code
+        if key == 'headers':
+            return response.headers
+        if key == 'body':
+            return response.content.decode(response.encoding or 'utf-8',
+                                           'replace')
+        if (key == 'dict' and response.status_code < requests.codes.bad_request
+                and response.content):
+            if self._dict is None:
+                self._dict = jsonutils.loads(response.content)
+            return self._dict
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self, collection):
+        """Yield the items of collection in the body, one at a time.
+
+        See bg_stream.iter_collection for the accepted layouts.
+        """
+        size = [0]
+
+        def chunks():
+            if not self.streamed:
+                yield self.response.content
+                return
+            for chunk in self.response.iter_content(STREAM_CHUNK_SIZE):
+                size[0] += len(chunk)
+                yield chunk
+            if self.metrics is not None:
+                observe_response_body(self.metrics, self.response, size[0])
+
+        try:
+            for item in bg_stream.iter_collection(chunks(), collection):
+                yield item
+        except requests.exceptions.RequestException:
+            LOG.exception(_("Reading a response from %s failed"),
+                          self.response.url)
+            raise BGException(BGException.CONNECTION_ERROR)
+        except ValueError:
+            LOG.exception(_("Malformed response from %s"),
+                          self.response.url)
+            raise BGException(BGException.RESPONSE_ERROR)
+        finally:
+            self.response.close()
+
+
+def observe_response_body(metrics, response, size):
+    """Count a response body of size bytes if it came compressed."""
+    encoding = response.headers.get(ENCODING_HEADER, '').lower()
+    if encoding in (COMPRESSION_GZIP, COMPRESSION_DEFLATE):
+        # bytes read from the socket, before decoding
+        metrics.observe_body('response', size, response.raw.tell())
 
 
 class BGClient(object):
 
     """Client to operate on REST resources of Banggoo Control Center."""
 
-    def __init__(self, service_uri, username, password):
+    def __init__(self, service_uri, username, password,
+                 pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                 pool_idle_timeout=DEFAULT_POOL_IDLE_TIMEOUT,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeouts=None, breaker=None, max_retries=0,
+                 retry_backoff=0.5, scheduler=None, auth_mode=AUTH_BASIC,
+                 token_refresh_margin=DEFAULT_TOKEN_REFRESH_MARGIN,
+                 token_lifetime=DEFAULT_TOKEN_LIFETIME, journal=None,
+                 compression=COMPRESSION_NONE,
+                 compression_threshold=DEFAULT_COMPRESSION_THRESHOLD,
+                 accept_compressed=True):
         if not service_uri:
             msg = _("No Banggoo Control Center URI specified. "
                     "Cannot connect.")
@@ -57,10 +326,149 @@ class BGClient(object):
             raise BGException(BGException.CONNECTION_ERROR)
         self.service_uri = service_uri.strip('/')
         self.auth = None
+        self.token_auth = None
         if username and password:
-            base64string = base64.encodestring("%s:%s" % (username, password))
-            base64string = base64string[:-1]
-            self.auth = 'Basic %s' % base64string
+            if auth_mode == AUTH_TOKEN:
+                self.token_auth = TokenAuth(self, username, password,
+                                            token_refresh_margin,
+                                            token_lifetime)
+            else:
+                credentials = ("%s:%s" % (username, password)).encode('utf-8')
+                self.auth = 'Basic %s' % base64.b64encode(
+                    credentials).decode('ascii')
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_idle_timeout = pool_idle_timeout
+        self.connect_timeout = connect_timeout
+        # read timeout per HTTP method
+        self.read_timeouts = read_timeouts or {}
+        self.breaker = breaker or CircuitBreaker(0, 0)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        # optional bg_sched.FairScheduler admitting calls per tenant
+        self.scheduler = scheduler
+        # optional bg_journal.Journal recording mutations before they are sent
+        self.journal = journal
+        if compression not in COMPRESSIONS:
+            LOG.warn(_("Unknown compression %(compression)s for %(uri)s, "
+                       "sending requests uncompressed"),
+                     {'compression': compression, 'uri': service_uri})
+            compression = COMPRESSION_NONE
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.accept_encoding = 'identity'
+        if accept_compressed:
+            self.accept_encoding = 'gzip, deflate'
+        self.metrics = bg_metrics.ClientMetrics()
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._last_used = 0
+        self._sessions_created = 0
+        # counters of sessions already recycled, so pool_stats() does not
+        # lose history every time an idle session is thrown away
+        self._retired_requests = 0
+        self._retired_connections = 0
+
+    def pool_stats(self):
+        """Return reuse counters of the keep-alive connection pool."""
+        with self._session_lock:
+            requests_sent, connections = self._session_counters(self._session)
+            requests_sent += self._retired_requests
+            connections += self._retired_connections
+            return {'sessions': self._sessions_created,
+                    'requests': requests_sent,
+                    'connections': connections,
+                    'reused': max(requests_sent - connections, 0)}
+
+    def warm_up(self, connections=1):
+        """Open pooled connections and log in ahead of the first request.
+
+        Up to pool_maxsize connections are established, including the TLS
+        handshake, and put back into the keep-alive pool; with token
+        authentication a token is fetched as well. Returns the number of
+        connections opened.
+        """
+        url = self.service_uri + '/'
+        adapter = self._get_session().get_adapter(url)
+        if hasattr(adapter, 'get_connection_with_tls_context'):
+            # newer requests key the pools by TLS settings as well, pick the
+            # one requests sent with verify=False will use
+            pool = adapter.get_connection_with_tls_context(
+                requests.Request('GET', url).prepare(), verify=False)
+        else:
+            pool = adapter.get_connection(url)
+        conns = []
+        try:
+            for _i in range(min(connections, self.pool_maxsize)):
+                conn = pool._get_conn()
+                conns.append(conn)
+                if conn.sock is None:
+                    conn.connect()
+        except Exception:
+            LOG.warn(_("Unable to open connections to %s"), self.service_uri)
+            raise BGException(BGException.CONNECTION_ERROR)
+        finally:
+            for conn in conns:
+                pool._put_conn(conn)
+        if self.token_auth is not None:
+            self.token_auth.get()
+        return len(conns)
+
+    def close(self):
+        """Close every pooled connection to the Control Center."""
+        with self._session_lock:
+            self._retire_session()
+
+    def _session_counters(self, session):
+        requests_sent = connections = 0
+        if session is None:
+            return requests_sent, connections
+        # the same adapter is mounted for http and https
+        adapters_seen = dict((id(adapter), adapter)
+                             for adapter in session.adapters.values())
+        for adapter in adapters_seen.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                requests_sent += pool.num_requests
+                connections += pool.num_connections
+        return requests_sent, connections
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = adapters.HTTPAdapter(pool_connections=self.pool_connections,
+                                       pool_maxsize=self.pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.verify = False
+        self._sessions_created += 1
+        return session
+
+    def _retire_session(self):
+        if self._session is None:
+            return
+        requests_sent, connections = self._session_counters(self._session)
+        self._retired_requests += requests_sent
+        self._retired_connections += connections
+        self._session.close()
+        self._session = None
+
+    def _get_session(self):
+        # connection pools of urllib3 are thread safe, the lock only guards
+        # creation and idle recycling of the session that owns them
+        with self._session_lock:
+            now = time.time()
+            if (self._session is not None and self.pool_idle_timeout and
+                    now - self._last_used > self.pool_idle_timeout):
+                LOG.debug(_("Recycling idle connection pool to %s"),
+                          self.service_uri)
+                self._retire_session()
+            if self._session is None:
+                self._session = self._new_session()
+            self._last_used = now
+            return self._session
 
     def create_resource(self, tenant_id, resource_path, object_name,
                         object_data):
@@ -74,6 +482,17 @@ class BGClient(object):
         """Retrieve a resource of Banggoo Control Center."""
         return self._resource_operation('GET', tenant_id, resource_path)
 
+    def retrieve_collection(self, tenant_id, resource_path, collection):
+        """Retrieve a collection of Banggoo Control Center item by item.
+
+        Returns an iterator of the items as LazyResponse.items() yields
+        them. The response is streamed and decoded while the iterator
+        advances, so it must be consumed.
+        """
+        resp_dict = self._resource_operation('GET', tenant_id,
+                                             resource_path, stream=True)[1]
+        return resp_dict.items(collection)
+
     def update_resource(self, tenant_id, resource_path, object_name,
                         object_data):
         """Update a resource of the Banggoo Control Center."""
@@ -86,24 +505,111 @@ class BGClient(object):
         """Remove a resource of Banggoo Control Center."""
         return self._resource_operation('DELETE', tenant_id, resource_path)
 
+    def bulk_create_resources(self, tenant_id, resource_path,
+                              collection_name, objects):
+        """Create several resources of Banggoo Control Center at once."""
+        return self._resource_operation('POST', tenant_id,
+                                        resource_path + '/bulk',
+                                        object_name=collection_name,
+                                        object_data=objects)
+
+    def bulk_remove_resources(self, tenant_id, resource_path, ids):
+        """Remove several resources of Banggoo Control Center at once."""
+        return self._resource_operation('POST', tenant_id,
+                                        resource_path + '/bulk_delete',
+                                        object_name='ids',
+                                        object_data=ids)
+
+    def replay(self, entry):
+        """Resend a journaled operation with its original idempotency key."""
+        return self._resource_operation(
+            entry['method'], entry['tenant_id'], entry['path'],
+            object_name=entry.get('object_name'),
+            object_data=entry.get('object_data'),
+            idempotency_key=entry['key'])
+
+    def failed_bulk_items(self, resp_dict, ids):
+        """Return the ids a bulk operation did not apply.
+
+        The Control Center answers bulk requests with one result per item,
+        ``{"results": [{"id": ..., "status": <http status>}, ...]}``. Items
+        without a result are treated as failed.
+        """
+        results = (resp_dict.get('dict') or {}).get('results') or []
+        statuses = dict((item.get('id'), item.get('status'))
+                        for item in results)
+        return set(item_id for item_id in ids
+                   if not statuses.get(item_id) or
+                   not self._is_valid_response(int(statuses[item_id])))
+
     def _resource_operation(self, method, tenant_id, resource_path,
-                            object_name=None, object_data=None):
+                            object_name=None, object_data=None,
+                            idempotency_key=None, stream=False):
         resource_uri = "%s/%s" % (self.service_uri, resource_path)
         headers = self._setup_req_headers(tenant_id)
+        journal_key = None
+        if (idempotency_key is None and self.journal is not None and
+                method != 'GET'):
+            journal_key = idempotency_key = self.journal.begin(
+                uri=self.service_uri, method=method, tenant_id=tenant_id,
+                path=resource_path, object_name=object_name,
+                object_data=object_data)
+        if idempotency_key is not None:
+            headers[IDEMPOTENCY_HEADER] = idempotency_key
         request_body = None
         if object_data:
             if isinstance(object_data, str):
                 request_body = object_data
             else:
                 obj_dict = {object_name: object_data}
-                request_body = jsonutils.dumps(obj_dict)
+                with bg_trace.span('serialize'):
+                    request_body = jsonutils.dumps(obj_dict)
+            if (self.compression != COMPRESSION_NONE and
+                    len(request_body) >= self.compression_threshold):
+                with bg_trace.span('compress'):
+                    request_body = self._compress(headers, request_body)
 
-        response_status, resp_dict = self._execute_request(method,
-                                                           resource_uri,
-                                                           headers,
-                                                           body=request_body)
+        if self.scheduler is not None:
+            # bulk requests cost one token per object they carry
+            cost = len(object_data) if isinstance(object_data, list) else 1
+            with bg_trace.span('queue'):
+                self.scheduler.acquire(tenant_id, cost)
+        started = time.time()
+        try:
+            with bg_trace.span('http'):
+                response_status, resp_dict = self._execute_request(
+                    method, resource_uri, headers, body=request_body,
+                    stream=stream)
+        except BGException as e:
+            self.metrics.observe(method, resource_path,
+                                 time.time() - started,
+                                 status=e.status, error=e.error)
+            raise
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.release()
+            if journal_key is not None:
+                # done once the driver has updated the database as well
+                self.journal.finish(journal_key)
+        self.metrics.observe(method, resource_path, time.time() - started,
+                             status=response_status)
         return response_status, resp_dict
 
+    def _compress(self, headers, body):
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        if self.compression == COMPRESSION_GZIP:
+            compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            compressed = compressor.compress(body) + compressor.flush()
+        else:
+            compressed = zlib.compress(body, 6)
+        if len(compressed) >= len(body):
+            return body
+        headers[ENCODING_HEADER] = self.compression
+        self.metrics.observe_body('request', len(body), len(compressed))
+        return compressed
+
     def _is_valid_response(self, response_status):
         # when status is less than 400, the response is fine
         return response_status < requests.codes.bad_request
@@ -113,22 +619,89 @@ class BGClient(object):
                    CONTENT_TYPE_HEADER: JSON_CONTENT_TYPE,
                    DRIVER_HEADER: DRIVER_HEADER_VALUE,
                    TENANT_HEADER: tenant_id,
-                   AUTH_HEADER: self.auth}
+                   AUTH_HEADER: self.auth,
+                   ACCEPT_ENCODING_HEADER: self.accept_encoding,
+                   bg_trace.TRACE_HEADER: bg_trace.current_id()}
         return headers
 
-    def _get_response_dict(self, response):
-        response_dict = {'status': response.status_code,
-                         'body': response.text,
-                         'headers': response.headers}
-        if self._is_valid_response(response.status_code):
-            if response.text:
-                response_dict['dict'] = response.json()
-        return response_dict
+    def _log_response(self, resp_dict):
+        if resp_dict.streamed:
+            LOG.debug(_("Response: %s, body streamed"), resp_dict['status'])
+            return
+        body = resp_dict['body']
+        if len(body) > DEBUG_BODY_LIMIT:
+            body = "%s... (%d characters)" % (body[:DEBUG_BODY_LIMIT],
+                                             len(body))
+        LOG.debug(_("Response: %s"), body)
 
-    def _execute_request(self, method, resource_uri, headers, body=None):
+    def _execute_request(self, method, resource_uri, headers, body=None,
+                         stream=False):
+        if not self.breaker.allow():
+            LOG.warn(_("Circuit to %s is open, failing fast"),
+                     self.service_uri)
+            raise BGException(BGException.CONNECTION_ERROR)
+        attempts = 1
+        if method in IDEMPOTENT_METHODS:
+            attempts += self.max_retries
+        for attempt in range(attempts):
+            try:
+                result = self._send_authorized(method, resource_uri,
+                                               headers, body, stream)
+            except BGException as e:
+                if not self._is_transient(e):
+                    # the device answered, it is healthy
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt + 1 >= attempts or not self.breaker.allow():
+                    raise
+                delay = random.uniform(
+                    0, min(self.retry_backoff * 2 ** attempt,
+                           MAX_RETRY_BACKOFF))
+                LOG.warn(_("Retrying %(method)s %(url)s in %(delay).2fs"),
+                         {'method': method, 'url': resource_uri,
+                          'delay': delay})
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+    def _send_authorized(self, method, resource_uri, headers, body,
+                         stream=False):
+        if self.token_auth is None:
+            return self._send_request(method, resource_uri, headers, body,
+                                      stream)
+        token = headers[TOKEN_HEADER] = self.token_auth.get()
         try:
-            response = requests.request(method, url=resource_uri,
-                                        headers=headers, data=body, verify=False)
+            return self._send_request(method, resource_uri, headers, body,
+                                      stream)
+        except BGException as e:
+            if e.status != requests.codes.unauthorized:
+                raise
+        # the token expired early or was revoked: log in again, once
+        LOG.info(_("Token rejected by %s, logging in again"),
+                 self.service_uri)
+        self.token_auth.invalidate(token)
+        headers[TOKEN_HEADER] = self.token_auth.get()
+        return self._send_request(method, resource_uri, headers, body,
+                                  stream)
+
+    def _is_transient(self, e):
+        if e.error == BGException.CONNECTION_ERROR:
+            return True
+        return e.status is not None and e.status >= 500
+
+    def _send_request(self, method, resource_uri, headers, body,
+                      stream=False):
+        timeout = (self.connect_timeout,
+                   float(self.read_timeouts.get(method,
+                                                DEFAULT_READ_TIMEOUT)))
+        try:
+            session = self._get_session()
+            response = session.request(method, url=resource_uri,
+                                       headers=headers, data=body,
+                                       verify=False, timeout=timeout,
+                                       stream=stream)
         except requests.exceptions.ConnectionError:
             msg = (_("Connection error occurred while connecting to %s") %
                    self.service_uri)
@@ -164,19 +737,29 @@ class BGClient(object):
                    self.service_uri)
             LOG.exception(msg)
             raise BGException(BGException.UNKNOWN_ERROR)
-        resp_dict = self._get_response_dict(response)
-        LOG.debug(_("Response: %s"), resp_dict['body'])
+        resp_dict = LazyResponse(response, streamed=stream,
+                                 metrics=self.metrics)
+        if not stream:
+            observe_response_body(self.metrics, response,
+                                  len(response.content))
+        if LOG.isEnabledFor(std_logging.DEBUG):
+            self._log_response(resp_dict)
         response_status = resp_dict['status']
+        if stream and not self._is_valid_response(response_status):
+            # nobody is going to read the body
+            response.close()
         if response_status == requests.codes.unauthorized:
             LOG.exception(_("Unable to login. Invalid credentials passed."
                           "for: %s"), self.service_uri)
-            raise BGException(BGException.RESPONSE_ERROR)
+            raise BGException(BGException.RESPONSE_ERROR,
+                              status=response_status)
 
         #add by jfwu
         if response_status == requests.codes.bad_request:
             LOG.exception(_("Bad request123."
                           "for: %s"), self.service_uri)
-            raise BGException(BGException.RESPONSE_ERROR)
+            raise BGException(BGException.RESPONSE_ERROR,
+                              status=response_status)
 
         if not self._is_valid_response(response_status):
             msg = (_("Failed %(method)s operation on %(url)s "
@@ -185,5 +768,6 @@ class BGClient(object):
                     "url": resource_uri,
                     "response_status": response_status})
             LOG.exception(msg)
-            raise BGException(BGException.RESPONSE_ERROR)
+            raise BGException(BGException.RESPONSE_ERROR,
+                              status=response_status)
         return response_status, resp_dict
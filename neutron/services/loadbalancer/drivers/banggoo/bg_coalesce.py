@@ -0,0 +1,111 @@
+import threading
+
+import eventlet
+from eventlet import event
+
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class _Update(object):
+
+    def __init__(self, func, context, old, new, args):
+        self.func = func
+        self.context = context
+        self.old = old
+        self.new = new
+        self.args = args
+        self.merged = 0
+        self.done = event.Event()
+
+    def run(self):
+        error = None
+        try:
+            self.func(self.context, self.old, self.new, *self.args)
+        except Exception as e:
+            error = e
+        self.done.send(error)
+        return error
+
+
+class UpdateCoalescer(object):
+
+    """Collapses queued updates of the same object into one.
+
+    An update submitted while an earlier update of the same key is still
+    waiting to start is merged into it: the merged update keeps the old
+    state of the first and takes the new state of the last, so
+    ``func(context, old, new, *args)`` sees every change in between while
+    only the newest state is sent. Callers merged into an update share its
+    outcome. Device load therefore follows the number of objects that
+    change rather than the number of changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> _Update not started yet
+        self._pending = {}
+        # keys a blocking caller is pushing updates of
+        self._running = set()
+        self.merged = 0
+
+    def _add(self, key, func, context, old, new, args):
+        update = self._pending.get(key)
+        if update is None:
+            update = self._pending[key] = _Update(func, context, old, new,
+                                                  args)
+            return update, True
+        update.new = new
+        update.merged += 1
+        self.merged += 1
+        LOG.debug(_("Banggoo update of %(key)s merged with %(count)d "
+                    "queued ones"), {'key': key, 'count': update.merged})
+        return update, False
+
+    def push(self, key, func, context, old, new, *args):
+        """Send an update and wait for the update that carried it.
+
+        The first caller of a key pushes its update; updates queued
+        behind it meanwhile are pushed by a green thread of their own, so
+        the caller returns as soon as its update is done. Later callers
+        wait. Raises the exception of the update, if any.
+        """
+        with self._lock:
+            update, _created = self._add(key, func, context, old, new, args)
+            leader = key not in self._running
+            if leader:
+                self._running.add(key)
+        if leader:
+            self._push_next(key)
+        error = update.done.wait()
+        if error is not None:
+            raise error
+
+    def _push_next(self, key):
+        with self._lock:
+            update = self._pending.pop(key)
+        update.run()
+        with self._lock:
+            if key not in self._pending:
+                self._running.discard(key)
+                return
+        eventlet.spawn_n(self._push_next, key)
+
+    def queue(self, key, func, context, old, new, *args):
+        """Queue an update without waiting for it.
+
+        Returns True when a new update was queued, for which the caller
+        must arrange a later ``run(key)``; False when it was merged.
+        """
+        with self._lock:
+            return self._add(key, func, context, old, new, args)[1]
+
+    def run(self, key):
+        """Send the update queued for key, if any, raising its error."""
+        with self._lock:
+            update = self._pending.pop(key, None)
+        if update is not None:
+            error = update.run()
+            if error is not None:
+                raise error
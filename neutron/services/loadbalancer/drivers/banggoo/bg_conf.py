@@ -2,20 +2,34 @@ import os
 import re
 
 BG_CONF = "/etc/neutron/services/loadbalancer/banggoo/banggoo_config.ini"
+PATTERN = re.compile("\s*(\w+)\s*=\s*(.*)")
 
 def cfgparse():
-    patten = "\s*(\w+)\s*=\s*(.*)"
-
     if not os.path.exists(BG_CONF):
         return {}
 
     conf = {}
 
-    lines = file(BG_CONF).readlines()
-    for line in lines:
-        match_res = re.match(patten, line)
+    with open(BG_CONF) as lines:
+        for line in lines:
+            match_res = PATTERN.match(line)
 
-        if match_res:
-            conf[match_res.group(1)] = match_res.group(2)
+            if match_res:
+                conf[match_res.group(1)] = match_res.group(2)
  
     return conf
+
+
+def getbool(conf, name, default=False):
+    value = conf.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def getdict(conf, name, default=None):
+    value = conf.get(name)
+    if value is None:
+        return default or {}
+    items = [item.split(':', 1) for item in value.split(',') if ':' in item]
+    return dict((k.strip(), v.strip()) for k, v in items)
@@ -0,0 +1,143 @@
+import collections
+import threading
+
+import eventlet
+
+from neutron.openstack.common import log as logging
+from neutron.services.loadbalancer.drivers.banggoo import bg_client
+
+LOG = logging.getLogger(__name__)
+
+# seconds between a failed write to a standby and its resync
+DEFAULT_RESYNC_DELAY = 30
+
+
+class DeviceGroup(object):
+
+    """Active/standby group of Control Centers holding the same objects.
+
+    Offers the resource operations of BGClient. Writes are sent to every
+    device of the group in parallel, so they take as long as the slowest
+    device rather than the sum of all; the outcome on the active device
+    (the first one) is the outcome of the call. Reads go to the active
+    device only. A standby that fails a write is marked lagging and,
+    ``resync_delay`` seconds later, handed to ``resync(group, client)``,
+    which must bring it back in line with neutron and return whether it
+    did; otherwise it is retried after another delay.
+    """
+
+    def __init__(self, clients, resync=None,
+                 resync_delay=DEFAULT_RESYNC_DELAY):
+        self.clients = clients
+        self.active = clients[0]
+        self.standbys = clients[1:]
+        self.service_uri = self.active.service_uri
+        self.resync = resync
+        self.resync_delay = resync_delay
+        # uri -> writes the device failed
+        self.failures = collections.defaultdict(int)
+        # uris of standbys missing writes
+        self.lagging = set()
+        self._resyncing = set()
+        self._lock = threading.Lock()
+
+    def status(self):
+        """Return role, failed writes and lag of every device."""
+        return dict((client.service_uri,
+                     {'role': 'active' if client is self.active
+                      else 'standby',
+                      'failures': self.failures[client.service_uri],
+                      'lagging': client.service_uri in self.lagging})
+                    for client in self.clients)
+
+    def retrieve_resource(self, tenant_id, *args, **kwargs):
+        return self.active.retrieve_resource(tenant_id, *args, **kwargs)
+
+    def retrieve_collection(self, tenant_id, *args, **kwargs):
+        return self.active.retrieve_collection(tenant_id, *args, **kwargs)
+
+    def failed_bulk_items(self, resp_dict, ids):
+        return self.active.failed_bulk_items(resp_dict, ids)
+
+    def create_resource(self, tenant_id, *args, **kwargs):
+        return self._write('create_resource', tenant_id, *args, **kwargs)
+
+    def update_resource(self, tenant_id, *args, **kwargs):
+        return self._write('update_resource', tenant_id, *args, **kwargs)
+
+    def remove_resource(self, tenant_id, *args, **kwargs):
+        return self._write('remove_resource', tenant_id, *args, **kwargs)
+
+    def bulk_create_resources(self, tenant_id, *args, **kwargs):
+        return self._write('bulk_create_resources', tenant_id, *args,
+                           **kwargs)
+
+    def bulk_remove_resources(self, tenant_id, *args, **kwargs):
+        return self._write('bulk_remove_resources', tenant_id, *args,
+                           **kwargs)
+
+    def _write(self, operation, tenant_id, *args, **kwargs):
+        if not self.standbys:
+            return getattr(self.active, operation)(tenant_id, *args,
+                                                   **kwargs)
+        threads = [eventlet.spawn(self._standby_write, client, operation,
+                                  tenant_id, args, kwargs)
+                   for client in self.standbys]
+        try:
+            result = getattr(self.active, operation)(tenant_id, *args,
+                                                     **kwargs)
+        except bg_client.BGException:
+            self._failed(self.active, operation, args)
+            raise
+        finally:
+            for thread in threads:
+                thread.wait()
+        return result
+
+    def _standby_write(self, client, operation, tenant_id, args, kwargs):
+        try:
+            getattr(client, operation)(tenant_id, *args, **kwargs)
+        except bg_client.BGException as e:
+            if operation == 'remove_resource' and e.status == 404:
+                # already gone from the standby
+                return
+            self._failed(client, operation, args)
+            self._lag(client)
+
+    def _failed(self, client, operation, args):
+        self.failures[client.service_uri] += 1
+        LOG.warn(_("%(operation)s %(path)s failed on %(role)s Control "
+                   "Center %(uri)s"),
+                 {'operation': operation, 'path': args[0],
+                  'role': 'active' if client is self.active else 'standby',
+                  'uri': client.service_uri})
+
+    def _lag(self, client):
+        uri = client.service_uri
+        with self._lock:
+            self.lagging.add(uri)
+            if self.resync is None or uri in self._resyncing:
+                return
+            self._resyncing.add(uri)
+        eventlet.spawn_after(self.resync_delay, self._resync, client)
+
+    def _resync(self, client):
+        uri = client.service_uri
+        with self._lock:
+            # writes failing from here on need another resync
+            self.lagging.discard(uri)
+        try:
+            in_sync = self.resync(self, client)
+        except Exception:
+            LOG.exception(_("Resync of standby Control Center %s failed"),
+                          uri)
+            in_sync = False
+        if not in_sync:
+            with self._lock:
+                self.lagging.add(uri)
+        with self._lock:
+            if uri in self.lagging:
+                eventlet.spawn_after(self.resync_delay, self._resync, client)
+            else:
+                self._resyncing.discard(uri)
+                LOG.info(_("Standby Control Center %s is in sync"), uri)
@@ -0,0 +1,108 @@
+import threading
+
+from neutron import context as n_context
+from neutron.db.loadbalancer import loadbalancer_db
+from neutron.openstack.common import log as logging
+from neutron.openstack.common import loopingcall
+from neutron.plugins.common import constants
+from neutron.services.loadbalancer.drivers.banggoo import bg_client
+
+LOG = logging.getLogger(__name__)
+
+# member health reported by the device -> neutron status
+DEVICE_STATUSES = {'UP': constants.ACTIVE,
+                   'ACTIVE': constants.ACTIVE,
+                   'DOWN': constants.INACTIVE,
+                   'INACTIVE': constants.INACTIVE}
+# statuses the poller may overwrite; anything else belongs to an
+# operation in progress or a failed push
+POLLED_STATUSES = (constants.ACTIVE, constants.INACTIVE)
+# member ids per UPDATE ... WHERE id IN (...) statement
+CHUNK_SIZE = 500
+# polls between reloads of the known statuses from the database
+RESEED_POLLS = 10
+
+
+class MemberStatusPoller(object):
+
+    """Mirrors member health reported by the Control Centers into neutron.
+
+    ``fetch()`` must return a dict of member_id -> device health for every
+    member, with one bulk request per device. Each poll compares it with
+    the last known statuses and writes only the members that changed, in
+    one transaction with one chunked UPDATE per status, so DB writes
+    follow the number of changes rather than the number of members. The
+    known statuses are reloaded from the database every RESEED_POLLS
+    polls to pick up writes made elsewhere.
+    """
+
+    def __init__(self, fetch, interval):
+        self.fetch = fetch
+        self.interval = interval
+        self._known = None
+        self._polls = 0
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def start(self):
+        self._timer = loopingcall.FixedIntervalLoopingCall(self.poll)
+        self._timer.start(interval=self.interval, initial_delay=self.interval)
+
+    def stop(self):
+        if self._timer:
+            self._timer.stop()
+            self._timer = None
+
+    def poll(self):
+        if not self._lock.acquire(False):
+            return
+        try:
+            self._poll()
+        except bg_client.BGException:
+            LOG.warn(_("Bulk member status poll failed"))
+        except Exception:
+            # never let the looping call die on an unexpected reply
+            LOG.exception(_("Unexpected error polling member status"))
+        finally:
+            self._lock.release()
+
+    def _poll(self):
+        health = self.fetch()
+        context = n_context.get_admin_context()
+        if self._known is None or self._polls % RESEED_POLLS == 0:
+            self._known = self._load(context)
+        self._polls += 1
+        changes = {}
+        for member_id, device_status in health.items():
+            status = DEVICE_STATUSES.get(str(device_status).upper())
+            known = self._known.get(member_id)
+            if (status is None or known not in POLLED_STATUSES or
+                    known == status):
+                continue
+            changes.setdefault(status, []).append(member_id)
+        if not changes:
+            return
+        self._write(context, changes)
+        for status, member_ids in changes.items():
+            for member_id in member_ids:
+                self._known[member_id] = status
+        LOG.info(_("Member status poll updated %d members"),
+                 sum(len(ids) for ids in changes.values()))
+
+    def _load(self, context):
+        query = context.session.query(loadbalancer_db.Member.id,
+                                      loadbalancer_db.Member.status)
+        return dict((member_id, status) for member_id, status in query)
+
+    def _write(self, context, changes):
+        member = loadbalancer_db.Member
+        with context.session.begin(subtransactions=True):
+            for status, member_ids in changes.items():
+                for i in range(0, len(member_ids), CHUNK_SIZE):
+                    chunk = member_ids[i:i + CHUNK_SIZE]
+                    # the status filter leaves members alone that went
+                    # PENDING_* since they were loaded
+                    context.session.query(member).filter(
+                        member.id.in_(chunk),
+                        member.status.in_(POLLED_STATUSES)).update(
+                            {'status': status}, synchronize_session=False)
@@ -0,0 +1,131 @@
+import array
+import collections
+import threading
+import time
+
+# cumulative counters, turned into per second rates
+COUNTERS = ('bytes_in', 'bytes_out', 'total_connections')
+# instantaneous values, aggregated as peak and average
+GAUGES = ('active_connections',)
+FIELDS = COUNTERS + GAUGES
+
+
+class PoolHistory(object):
+
+    """Ring buffer of the last ``size`` statistics samples of a pool.
+
+    Samples live in one array('d') per field plus one for the sample
+    times, 8 bytes per value, so memory is fixed per pool.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.times = array.array('d', [0.0]) * size
+        self.values = dict((field, array.array('d', [0.0]) * size)
+                           for field in FIELDS)
+        self.count = 0
+        # index the next sample is written to
+        self.head = 0
+
+    def add(self, now, stats):
+        if self.count and self.times[self.head - 1] >= now:
+            return
+        idx = self.head
+        self.times[idx] = now
+        for field in FIELDS:
+            try:
+                value = float(stats.get(field) or 0)
+            except (TypeError, ValueError):
+                value = 0.0
+            self.values[field][idx] = value
+        self.head = (idx + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def indexes(self, since):
+        """Return the indexes of samples taken at or after since, oldest
+        first."""
+        first = (self.head - self.count) % self.size
+        result = []
+        for i in range(self.count):
+            idx = (first + i) % self.size
+            if self.times[idx] >= since:
+                result.append(idx)
+        return result
+
+    def summary(self, since):
+        idxs = self.indexes(since)
+        result = {'samples': len(idxs)}
+        if not idxs:
+            return result
+        if len(idxs) > 1:
+            elapsed = self.times[idxs[-1]] - self.times[idxs[0]]
+            for field in COUNTERS:
+                values = self.values[field]
+                increase = 0.0
+                previous = values[idxs[0]]
+                for idx in idxs[1:]:
+                    value = values[idx]
+                    # a drop means the device reset its counters
+                    if value >= previous:
+                        increase += value - previous
+                    else:
+                        increase += value
+                    previous = value
+                result[field + '_rate'] = increase / elapsed
+        for field in GAUGES:
+            values = [self.values[field][idx] for idx in idxs]
+            result[field + '_peak'] = max(values)
+            result[field + '_avg'] = sum(values) / len(values)
+        return result
+
+
+class StatsHistory(object):
+
+    """Recent statistics samples of up to ``max_pools`` pools.
+
+    Pools are evicted least recently sampled first, which bounds memory to
+    ``max_pools * (len(FIELDS) + 1) * size * 8`` bytes plus overhead.
+    """
+
+    def __init__(self, size, max_pools):
+        self.size = size
+        self.max_pools = max_pools
+        self._lock = threading.Lock()
+        self._pools = collections.OrderedDict()
+
+    def record(self, pool_id, stats, now=None):
+        """Add a sample of the cumulative statistics of a pool."""
+        now = now or time.time()
+        with self._lock:
+            history = self._pools.pop(pool_id, None)
+            if history is None:
+                history = PoolHistory(self.size)
+                while len(self._pools) >= self.max_pools:
+                    self._pools.popitem(last=False)
+            self._pools[pool_id] = history
+            history.add(now, stats)
+
+    def forget(self, pool_id):
+        with self._lock:
+            self._pools.pop(pool_id, None)
+
+    def summary(self, pool_id, window, now=None):
+        """Return rates and aggregates of a pool over the last window
+        seconds, or None for a pool without samples.
+
+        Counters give ``<field>_rate`` per second, gauges ``<field>_peak``
+        and ``<field>_avg``.
+        """
+        since = (now or time.time()) - window
+        with self._lock:
+            history = self._pools.get(pool_id)
+            if history is None:
+                return None
+            return history.summary(since)
+
+    def summaries(self, window, now=None):
+        """Return summary() of every pool, keyed by pool id."""
+        since = (now or time.time()) - window
+        with self._lock:
+            return dict((pool_id, history.summary(since))
+                        for pool_id, history in self._pools.items())
@@ -0,0 +1,374 @@
+import collections
+import errno
+import functools
+import glob
+import os
+import re
+import threading
+import time
+import uuid
+
+from eventlet import tpool
+
+from neutron import context as n_context
+from neutron.extensions import loadbalancer
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import log as logging
+from neutron.plugins.common import constants
+from neutron.services.loadbalancer.drivers.banggoo import bg_client
+from neutron.services.loadbalancer.drivers.banggoo import bg_reconcile
+
+LOG = logging.getLogger(__name__)
+
+# done records written before the journal is rewritten without them
+COMPACT_EVERY = 1000
+
+BEGIN = 'begin'
+DONE = 'done'
+
+# green thread local once eventlet has patched threading
+_local = threading.local()
+
+
+class Journal(object):
+
+    """Write-ahead journal of device mutations.
+
+    Every POST, PUT and DELETE is recorded with an idempotency key before
+    it is sent. It is marked done once the driver has handled its outcome,
+    successful or not, including the database update that follows: inside
+    a ``journaled`` driver operation at the end of the operation,
+    elsewhere when the request returns. Only a crash leaves an entry
+    without its done record. Begin records are fsynced; a lost done record
+    merely causes a harmless replay.
+
+    Each process writes a file of its own, ``path`` suffixed with its
+    pid, so API workers forked after the journal was opened never write
+    to the same file. A file holds JSON lines and is rewritten with only
+    the open entries every COMPACT_EVERY done records, so its size follows
+    the number of operations in flight. ``load`` collects the entries left
+    open in the files of processes that are gone.
+    """
+
+    def __init__(self, path, compact_every=COMPACT_EVERY):
+        self.path = path
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._open = collections.OrderedDict()
+        self._done = 0
+        self._file = None
+        self._pid = None
+
+    def load(self):
+        """Open the journal and return the entries a crash left open."""
+        with self._lock:
+            self._open.clear()
+            paths = [path for path in self._paths()
+                     if not self._in_use(path)]
+            for path in paths:
+                self._read(path)
+            self._compact()
+            for path in paths:
+                if path != self._file.name:
+                    os.remove(path)
+            return list(self._open.values())
+
+    def begin(self, **entry):
+        """Record an operation about to be sent and return its key."""
+        entry.update(op=BEGIN, key=uuid.uuid4().hex, time=time.time())
+        with self._lock:
+            self._check_fork()
+            self._write(entry, sync=True)
+            self._open[entry['key']] = entry
+        return entry['key']
+
+    def finish(self, key):
+        """Mark key done at the end of the running journaled operation.
+
+        Without one, e.g. for the writes to a standby device, it is marked
+        done right away.
+        """
+        keys = getattr(_local, 'keys', None)
+        if keys is None:
+            self.done(key)
+        else:
+            keys.append(key)
+
+    def done(self, key):
+        """Record that the operation of key is finished."""
+        with self._lock:
+            self._check_fork()
+            if self._open.pop(key, None) is None:
+                return
+            self._write({'op': DONE, 'key': key})
+            self._done += 1
+            if self._done >= self.compact_every:
+                self._compact()
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def _write(self, record, sync=False):
+        self._file.write(jsonutils.dumps(record) + '\n')
+        self._file.flush()
+        if sync:
+            # keep the hub running while the disk catches up
+            tpool.execute(os.fsync, self._file.fileno())
+
+    def _paths(self):
+        # the file of every process, and that of versions without pids
+        pattern = re.compile(re.escape(self.path) + r'(\.\d+)?$')
+        return [path for path in glob.glob(self.path + '*')
+                if pattern.match(path)]
+
+    def _in_use(self, path):
+        pid = int(path[len(self.path) + 1:] or 0)
+        if not pid or pid == os.getpid():
+            return False
+        try:
+            os.kill(pid, 0)
+        except OSError as e:
+            return e.errno != errno.ESRCH
+        return True
+
+    def _read(self, path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = jsonutils.loads(line)
+                except ValueError:
+                    # torn write of the last record
+                    continue
+                if record.get('op') == BEGIN:
+                    self._open[record['key']] = record
+                elif record.get('op') == DONE:
+                    self._open.pop(record['key'], None)
+
+    def _check_fork(self):
+        if self._pid == os.getpid():
+            return
+        # a forked worker starts a file of its own; the entries it
+        # inherited are the parent's
+        if self._file:
+            self._file.close()
+            self._file = None
+        self._open.clear()
+        self._compact()
+
+    def _compact(self):
+        if self._file:
+            self._file.close()
+        self._pid = os.getpid()
+        path = '%s.%d' % (self.path, self._pid)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for entry in self._open.values():
+                f.write(jsonutils.dumps(entry) + '\n')
+            f.flush()
+            # keep the hub running while the disk catches up
+            tpool.execute(os.fsync, f.fileno())
+        os.rename(tmp_path, path)
+        self._file = open(path, 'a')
+        self._done = 0
+
+
+class operation(object):
+
+    """Defers the done records of the journal entries begun in the block.
+
+    They are written when the block exits, so a crash before the driver
+    has updated the database leaves them open for recovery.
+    """
+
+    def __init__(self, journal):
+        self.journal = journal
+        self.keys = None
+
+    def __enter__(self):
+        if self.journal is None or getattr(_local, 'keys', None) is not None:
+            # no journal, or nested in an enclosing operation
+            return
+        self.keys = _local.keys = []
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.keys is not None:
+            _local.keys = None
+            # an exception is an outcome the driver has handled as well
+            for key in self.keys:
+                self.journal.done(key)
+        return False
+
+
+def journaled(func):
+    """Decorator running a driver method as a journal operation."""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with operation(self.journal):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+def describe(entry):
+    """Return (kind, key, obj) of each object an entry touches.
+
+    ``key`` is the object id, or (monitor id, pool id) for monitors whose
+    pool is known; ``obj`` is the body sent for it, if any.
+    """
+    path = entry['path'].split('?', 1)[0]
+    parts = [part for part in path.split('/') if part]
+    data = entry.get('object_data')
+    kind = parts[0]
+    if len(parts) >= 3 and parts[2] == bg_reconcile.MONITORS:
+        # pools/<pool_id>/healthmonitors[/<monitor_id>]
+        hm_id = parts[3] if len(parts) > 3 else data['id']
+        return [(bg_reconcile.MONITORS, (hm_id, parts[1]), data)]
+    if len(parts) == 1:
+        return [(kind, data['id'], data)]
+    if parts[1] == 'bulk':
+        return [(kind, obj['id'], obj) for obj in data]
+    if parts[1] == 'bulk_delete':
+        return [(kind, obj_id, None) for obj_id in data]
+    return [(kind, parts[1], data)]
+
+
+class JournalRecovery(object):
+
+    """Resolves journal entries left open by a crash.
+
+    For each entry neutron decides: operations on objects it still has
+    are replayed with their original idempotency key, so a request that
+    did reach the device is not applied twice, and the object status is
+    settled. Objects created on the device that neutron no longer has are
+    removed again, and deletes are replayed and finished in the database.
+    The work done is proportional to the number of open entries.
+    """
+
+    def __init__(self, driver, journal):
+        self.driver = driver
+        self.journal = journal
+
+    def recover(self, entries):
+        context = n_context.get_admin_context()
+        for entry in entries:
+            try:
+                self._recover(context, entry)
+            except Exception:
+                LOG.exception(_("Recovery of journaled %(method)s %(path)s "
+                                "failed"), entry)
+                continue
+            self.journal.done(entry['key'])
+        LOG.info(_("Recovered %d journaled Banggoo operations"),
+                 len(entries))
+
+    def _recover(self, context, entry):
+        client = self.driver.client.client_by_uri(entry['uri'])
+        if client is None:
+            LOG.warn(_("Dropping journaled %(method)s %(path)s for unknown "
+                       "Control Center %(uri)s"), entry)
+            return
+        objects = [(kind, key, obj, self._get(context, kind, key))
+                   for kind, key, obj in describe(entry)]
+        if entry['method'] == 'DELETE' or entry['path'].endswith(
+                '/bulk_delete'):
+            self._replay(client, entry)
+            for kind, key, obj, db_obj in objects:
+                if (db_obj is not None and
+                        db_obj['status'] == constants.PENDING_DELETE):
+                    self._finish_delete(context, entry, kind, key, db_obj)
+            return
+        wanted = [db_obj is not None and
+                  db_obj['status'] != constants.PENDING_DELETE
+                  for _kind, _key, _obj, db_obj in objects]
+        status = constants.ACTIVE
+        if any(wanted):
+            try:
+                self._replay(client, entry)
+            except bg_client.BGException:
+                status = constants.ERROR
+        for (kind, key, obj, db_obj), want in zip(objects, wanted):
+            if want:
+                if db_obj['status'] in bg_reconcile.PENDING_STATUSES:
+                    self._set_status(context, kind, key, status)
+                if (kind == bg_reconcile.POOLS and entry['method'] == 'POST'
+                        and status == constants.ACTIVE):
+                    self.driver.snat_index.acquire(
+                        obj['tenant_id'], obj['subnet_id'], key)
+            elif db_obj is None and entry['method'] == 'POST':
+                self._roll_back(context, client, entry, kind, key, obj)
+
+    def _replay(self, client, entry):
+        LOG.info(_("Replaying journaled %(method)s %(path)s"), entry)
+        try:
+            client.replay(entry)
+        except bg_client.BGException as e:
+            if entry['method'] == 'DELETE' and e.status == 404:
+                return
+            raise
+
+    def _roll_back(self, context, client, entry, kind, key, obj):
+        LOG.info(_("Rolling back creation of %(kind)s %(key)s"),
+                 {'kind': kind, 'key': key})
+        if kind == bg_reconcile.MONITORS:
+            path = "%s/%s/%s/%s" % (bg_reconcile.POOLS, key[1], kind, key[0])
+        else:
+            path = "%s/%s" % (kind, key)
+        try:
+            client.remove_resource(entry['tenant_id'], path)
+        except bg_client.BGException as e:
+            if e.status != 404:
+                raise
+        if kind == bg_reconcile.POOLS:
+            # the SNAT port may have been allocated for it
+            self.driver._remove_snatport_for_subnet_if_not_used(
+                context, obj['tenant_id'], obj['subnet_id'], key)
+
+    def _get(self, context, kind, key):
+        plugin = self.driver.plugin
+        try:
+            if kind == bg_reconcile.VIPS:
+                return plugin.get_vip(context, key)
+            if kind == bg_reconcile.POOLS:
+                return plugin.get_pool(context, key)
+            if kind == bg_reconcile.MEMBERS:
+                return plugin.get_member(context, key)
+            if isinstance(key, tuple):
+                return plugin.get_pool_health_monitor(context, key[0],
+                                                      key[1])
+            # a monitor update does not name the pool
+            return dict(plugin.get_health_monitor(context, key),
+                        status=constants.ACTIVE)
+        except (loadbalancer.VipNotFound, loadbalancer.PoolNotFound,
+                loadbalancer.MemberNotFound,
+                loadbalancer.HealthMonitorNotFound,
+                loadbalancer.PoolMonitorAssociationNotFound):
+            return None
+
+    def _set_status(self, context, kind, key, status):
+        plugin = self.driver.plugin
+        if kind == bg_reconcile.MONITORS:
+            if isinstance(key, tuple):
+                plugin.update_pool_health_monitor(context, key[0], key[1],
+                                                  status, "")
+        else:
+            plugin.update_status(context, bg_reconcile.MODELS[kind], key,
+                                 status)
+
+    def _finish_delete(self, context, entry, kind, key, pool):
+        driver = self.driver
+        plugin = driver.plugin
+        if kind == bg_reconcile.VIPS:
+            plugin._delete_db_vip(context, key)
+        elif kind == bg_reconcile.POOLS:
+            if 'cascade=true' in entry['path']:
+                driver._delete_db_pool_cascade(context, key)
+            else:
+                plugin._delete_db_pool(context, key)
+            driver._remove_snatport_for_subnet_if_not_used(
+                context, pool['tenant_id'], pool['subnet_id'], key)
+        elif kind == bg_reconcile.MEMBERS:
+            plugin._delete_db_member(context, key)
+        elif isinstance(key, tuple):
+            plugin._delete_db_pool_health_monitor(context, key[0], key[1])
@@ -0,0 +1,246 @@
+import bisect
+import collections
+import os
+import tempfile
+
+from neutron.openstack.common import log as logging
+from neutron.openstack.common import loopingcall
+
+LOG = logging.getLogger(__name__)
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0)
+RESOURCE_TYPES = ('vips', 'pools', 'members', 'healthmonitors',
+                  'statistics')
+ERROR_CLASSES = {1: 'CONNECTION', 2: 'REQUEST', 3: 'RESPONSE',
+                 4: 'UNKNOWN'}
+
+
+def resource_type(resource_path):
+    """Return the resource type a request path operates on."""
+    for part in reversed(resource_path.split('?', 1)[0].split('/')):
+        if part in RESOURCE_TYPES:
+            return part
+    return 'other'
+
+
+class ClientMetrics(object):
+
+    """Request counters and latency histograms of one BGClient.
+
+    Recording only increments dict and list entries and takes no lock:
+    green threads switch on I/O only, so updates cannot interleave. The
+    histogram buckets are fixed, so memory does not grow with traffic.
+    """
+
+    def __init__(self):
+        # (method, resource) -> count
+        self.requests = collections.defaultdict(int)
+        # (method, resource, status code) -> count
+        self.statuses = collections.defaultdict(int)
+        # (method, resource, error class) -> count
+        self.errors = collections.defaultdict(int)
+        # (method, resource) -> per bucket counts, the last one is +Inf
+        self.latency = {}
+        # (method, resource) -> total seconds
+        self.latency_sum = collections.defaultdict(float)
+        # direction -> bytes of compressed bodies before compression
+        self.body_bytes = collections.defaultdict(int)
+        # direction -> bytes of compressed bodies on the wire
+        self.wire_bytes = collections.defaultdict(int)
+
+    def observe(self, method, resource_path, seconds, status=None,
+                error=None):
+        key = (method, resource_type(resource_path))
+        self.requests[key] += 1
+        if status is not None:
+            self.statuses[key + (status,)] += 1
+        if error is not None:
+            self.errors[key + (ERROR_CLASSES.get(error, 'UNKNOWN'),)] += 1
+        buckets = self.latency.get(key)
+        if buckets is None:
+            buckets = self.latency[key] = [0] * (len(LATENCY_BUCKETS) + 1)
+        buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.latency_sum[key] += seconds
+
+    def observe_body(self, direction, size, wire_size):
+        """Count a compressed request or response body."""
+        self.body_bytes[direction] += size
+        self.wire_bytes[direction] += wire_size
+
+
+def _labels(**labels):
+    return ','.join('%s="%s"' % (name, labels[name])
+                    for name in sorted(labels))
+
+
+def render(metrics_by_endpoint):
+    """Render ClientMetrics keyed by endpoint in Prometheus text format."""
+    lines = [
+        '# HELP banggoo_requests_total Requests sent to the Control Center.',
+        '# TYPE banggoo_requests_total counter']
+    for endpoint, metrics in sorted(metrics_by_endpoint.items()):
+        for (method, resource), count in sorted(metrics.requests.items()):
+            lines.append('banggoo_requests_total{%s} %d' % (
+                _labels(endpoint=endpoint, method=method,
+                        resource=resource), count))
+    lines += [
+        '# HELP banggoo_responses_total Responses by HTTP status code.',
+        '# TYPE banggoo_responses_total counter']
+    for endpoint, metrics in sorted(metrics_by_endpoint.items()):
+        for (method, resource, code), count in sorted(
+                metrics.statuses.items()):
+            lines.append('banggoo_responses_total{%s} %d' % (
+                _labels(endpoint=endpoint, method=method, resource=resource,
+                        code=code), count))
+    lines += [
+        '# HELP banggoo_errors_total Failed requests by error class.',
+        '# TYPE banggoo_errors_total counter']
+    for endpoint, metrics in sorted(metrics_by_endpoint.items()):
+        for (method, resource, error), count in sorted(
+                metrics.errors.items()):
+            lines.append('banggoo_errors_total{%s} %d' % (
+                _labels(endpoint=endpoint, method=method, resource=resource,
+                        error_class=error), count))
+    lines += [
+        '# HELP banggoo_request_duration_seconds Request latency.',
+        '# TYPE banggoo_request_duration_seconds histogram']
+    for endpoint, metrics in sorted(metrics_by_endpoint.items()):
+        for (method, resource), buckets in sorted(metrics.latency.items()):
+            labels = dict(endpoint=endpoint, method=method,
+                          resource=resource)
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                cumulative += count
+                lines.append(
+                    'banggoo_request_duration_seconds_bucket{%s} %d' % (
+                        _labels(le=bound, **labels), cumulative))
+            lines.append('banggoo_request_duration_seconds_sum{%s} %f' % (
+                _labels(**labels), metrics.latency_sum[(method, resource)]))
+            lines.append('banggoo_request_duration_seconds_count{%s} %d' % (
+                _labels(**labels), cumulative))
+    lines += [
+        '# HELP banggoo_compressed_bytes_total Bytes of compressed bodies '
+        'on the wire.',
+        '# TYPE banggoo_compressed_bytes_total counter']
+    for endpoint, metrics in sorted(metrics_by_endpoint.items()):
+        for direction, size in sorted(metrics.wire_bytes.items()):
+            lines.append('banggoo_compressed_bytes_total{%s} %d' % (
+                _labels(endpoint=endpoint, direction=direction), size))
+    lines += [
+        '# HELP banggoo_compression_saved_bytes_total Bytes compression '
+        'kept off the wire.',
+        '# TYPE banggoo_compression_saved_bytes_total counter']
+    for endpoint, metrics in sorted(metrics_by_endpoint.items()):
+        for direction, size in sorted(metrics.body_bytes.items()):
+            lines.append('banggoo_compression_saved_bytes_total{%s} %d' % (
+                _labels(endpoint=endpoint, direction=direction),
+                size - metrics.wire_bytes[direction]))
+    return '\n'.join(lines) + '\n'
+
+
+class TextfileExporter(object):
+
+    """Periodically writes metrics for the node exporter textfile collector.
+
+    ``collect()`` returns the text to write. The file is replaced
+    atomically so the collector never reads a partial file.
+    """
+
+    def __init__(self, path, collect, interval):
+        self.path = path
+        self.collect = collect
+        self.interval = interval
+        self._timer = None
+
+    def start(self):
+        self._timer = loopingcall.FixedIntervalLoopingCall(self.write)
+        self._timer.start(interval=self.interval)
+
+    def stop(self):
+        if self._timer:
+            self._timer.stop()
+            self._timer = None
+
+    def write(self):
+        try:
+            text = self.collect()
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(self.path) or '.', prefix='.banggoo')
+            with os.fdopen(fd, 'w') as f:
+                f.write(text)
+            os.chmod(tmp_path, 0o644)
+            os.rename(tmp_path, self.path)
+        except Exception:
+            LOG.exception(_("Unable to write Banggoo metrics to %s"),
+                          self.path)
+
+
+def render_scheduler(stats_by_endpoint):
+    """Render FairScheduler.stats() keyed by endpoint in Prometheus text."""
+    lines = [
+        '# HELP banggoo_scheduler_in_flight Device calls currently admitted.',
+        '# TYPE banggoo_scheduler_in_flight gauge']
+    for endpoint, stats in sorted(stats_by_endpoint.items()):
+        lines.append('banggoo_scheduler_in_flight{%s} %d' % (
+            _labels(endpoint=endpoint), stats['in_flight']))
+    for name, kind, key, fmt, doc in (
+            ('queued', 'gauge', 'queued', '%d',
+             'Device calls waiting for admission.'),
+            ('admitted_total', 'counter', 'admitted', '%d',
+             'Device calls admitted.'),
+            ('wait_seconds_total', 'counter', 'wait_seconds', '%f',
+             'Time device calls waited for admission.'),
+            ('max_wait_seconds', 'gauge', 'max_wait', '%f',
+             'Longest wait of a device call for admission.')):
+        metric = 'banggoo_scheduler_' + name
+        lines += ['# HELP %s %s' % (metric, doc),
+                  '# TYPE %s %s' % (metric, kind)]
+        for endpoint, stats in sorted(stats_by_endpoint.items()):
+            for tenant_id, tenant in sorted(stats['tenants'].items()):
+                lines.append(('%s{%s} ' + fmt) % (
+                    metric, _labels(endpoint=endpoint, tenant=tenant_id),
+                    tenant[key]))
+    return '\n'.join(lines) + '\n'
+
+
+def render_history(summaries):
+    """Render StatsHistory.summaries() in Prometheus text format."""
+    lines = []
+    for field, doc in (
+            ('bytes_in_rate', 'Bytes per second received by the pool.'),
+            ('bytes_out_rate', 'Bytes per second sent by the pool.'),
+            ('total_connections_rate', 'New connections per second.'),
+            ('active_connections_peak', 'Peak active connections.'),
+            ('active_connections_avg', 'Average active connections.')):
+        metric = 'banggoo_pool_' + field
+        lines += ['# HELP %s %s' % (metric, doc),
+                  '# TYPE %s gauge' % metric]
+        for pool_id, summary in sorted(summaries.items()):
+            if field in summary:
+                lines.append('%s{%s} %f' % (
+                    metric, _labels(pool=pool_id), summary[field]))
+    return '\n'.join(lines) + '\n'
+
+
+def render_groups(status_by_group):
+    """Render DeviceGroup.status() keyed by group in Prometheus text."""
+    lines = [
+        '# HELP banggoo_device_write_failures_total Writes a device of a '
+        'group failed.',
+        '# TYPE banggoo_device_write_failures_total counter']
+    for group, devices in sorted(status_by_group.items()):
+        for endpoint, device in sorted(devices.items()):
+            lines.append('banggoo_device_write_failures_total{%s} %d' % (
+                _labels(group=group, endpoint=endpoint, role=device['role']),
+                device['failures']))
+    lines += [
+        '# HELP banggoo_device_lagging Whether a standby misses writes.',
+        '# TYPE banggoo_device_lagging gauge']
+    for group, devices in sorted(status_by_group.items()):
+        for endpoint, device in sorted(devices.items()):
+            lines.append('banggoo_device_lagging{%s} %d' % (
+                _labels(group=group, endpoint=endpoint, role=device['role']),
+                device['lagging']))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,315 @@
+import hashlib
+import threading
+import time
+
+import eventlet
+
+from neutron import context as n_context
+from neutron.db.loadbalancer import loadbalancer_db
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import log as logging
+from neutron.openstack.common import loopingcall
+from neutron.plugins.common import constants
+from neutron.services.loadbalancer.drivers.banggoo import bg_client
+
+LOG = logging.getLogger(__name__)
+
+VIPS = 'vips'
+POOLS = 'pools'
+MEMBERS = 'members'
+MONITORS = 'healthmonitors'
+# parents first; removals run in the reverse order
+KINDS = (POOLS, MEMBERS, MONITORS, VIPS)
+OBJECT_NAMES = {VIPS: 'vip', POOLS: 'pool', MEMBERS: 'member',
+                MONITORS: 'healthmonitor'}
+MODELS = {VIPS: loadbalancer_db.Vip, POOLS: loadbalancer_db.Pool,
+          MEMBERS: loadbalancer_db.Member}
+PENDING_STATUSES = (constants.PENDING_CREATE, constants.PENDING_UPDATE,
+                    constants.PENDING_DELETE)
+# statuses a successful push settles to ACTIVE
+UNSETTLED_STATUSES = PENDING_STATUSES + (constants.ERROR,)
+
+
+def content_hash(obj, keys=None):
+    """Hash an object, optionally restricted to the given keys."""
+    if keys is not None:
+        obj = dict((key, obj.get(key)) for key in keys)
+    return hashlib.sha1(jsonutils.dumps(obj, sort_keys=True)).hexdigest()
+
+
+class _Desired(object):
+
+    def __init__(self, kind, key, obj, body, status, pool_id=None):
+        self.kind = kind
+        self.key = key
+        self.obj = obj
+        self.body = body
+        self.status = status
+        self.pool_id = pool_id
+        self.tenant_id = obj['tenant_id']
+
+
+class Reconciler(object):
+
+    """Brings Control Centers back in line with the neutron LBaaS tables.
+
+    Each run reads the full inventory of a device with one bulk GET per
+    resource type, diffs it against neutron using content hashes of the
+    fields the device knows about, and applies only the missing creates,
+    updates and deletes with at most ``concurrency`` requests in flight.
+    Objects in a PENDING_* state belong to an operation in progress and
+    are left alone. Objects in ERROR that turn out to match the device
+    are set back to ACTIVE. The device is read before neutron, so an
+    object created in between is seen as missing from the device rather
+    than as unknown to neutron, and is never removed.
+    """
+
+    def __init__(self, driver, concurrency=8):
+        self.driver = driver
+        self.concurrency = concurrency
+        self.last_report = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def start(self, interval, initial_delay=0):
+        """Reconcile every interval seconds, after initial_delay."""
+        self._timer = loopingcall.FixedIntervalLoopingCall(self.run)
+        self._timer.start(interval=interval, initial_delay=initial_delay)
+
+    def stop(self):
+        if self._timer:
+            self._timer.stop()
+            self._timer = None
+
+    def run(self):
+        """Reconcile every configured Control Center once."""
+        if not self._lock.acquire(False):
+            LOG.info(_("Banggoo reconciliation already running, skipped"))
+            return
+        try:
+            for client in self.driver.client.clients:
+                try:
+                    self.reconcile(client)
+                except Exception:
+                    LOG.exception(_("Reconciliation of %s failed"),
+                                  client.service_uri)
+        finally:
+            self._lock.release()
+
+    def reconcile(self, client, owns=None, update_status=True):
+        """Reconcile one device and return a report of what was done.
+
+        ``owns(tenant_id)`` tells whether a tenant's objects belong on the
+        device; by default the sharding of the driver's client decides.
+        Without ``update_status`` the status of the objects in neutron is
+        left alone, as for the standby of a device group.
+        """
+        if owns is None:
+            def owns(tenant_id):
+                return self.driver.client.client_for(tenant_id) is client
+        context = n_context.get_admin_context()
+        started = time.time()
+        # device first: whatever neutron adds meanwhile is not deleted
+        actual = self._device_state(client)
+        desired = self._desired_state(context, owns)
+        fetched = time.time()
+        creates, updates, deletes, repaired = self._diff(desired, actual)
+        diffed = time.time()
+        failures = self._apply(context, client, creates, updates, deletes,
+                               update_status)
+        if update_status:
+            for entry in repaired:
+                self._set_status(context, entry, constants.ACTIVE)
+        report = {'fetch_seconds': fetched - started,
+                  'diff_seconds': diffed - fetched,
+                  'apply_seconds': time.time() - diffed,
+                  'creates': len(creates),
+                  'updates': len(updates),
+                  'deletes': len(deletes),
+                  'repaired': len(repaired),
+                  'failures': failures}
+        self.last_report[client.service_uri] = report
+        msg = (_("Reconciled %(uri)s: %(creates)d creates, %(updates)d "
+                 "updates, %(deletes)d deletes, %(repaired)d repaired, "
+                 "%(failures)d failures; fetch %(fetch_seconds).2fs, diff "
+                 "%(diff_seconds).2fs, apply %(apply_seconds).2fs") %
+               dict(report, uri=client.service_uri))
+        LOG.info(msg)
+        return report
+
+    def _desired_state(self, context, owns):
+        driver = self.driver
+        plugin = driver.plugin
+        desired = dict((kind, {}) for kind in KINDS)
+        pools = [pool for pool in plugin.get_pools(context)
+                 if owns(pool['tenant_id'])]
+        for pool in pools:
+            desired[POOLS][pool['id']] = _Desired(
+                POOLS, pool['id'], pool,
+                driver._prepare_pool_for_creation(pool), pool['status'])
+        for member in plugin.get_members(context):
+            if owns(member['tenant_id']):
+                desired[MEMBERS][member['id']] = _Desired(
+                    MEMBERS, member['id'], member,
+                    driver._prepare_member_for_creation(member),
+                    member['status'], pool_id=member['pool_id'])
+        for vip in plugin.get_vips(context):
+            if owns(vip['tenant_id']):
+                desired[VIPS][vip['id']] = _Desired(
+                    VIPS, vip['id'], vip,
+                    driver._prepare_vip_for_creation(vip), vip['status'],
+                    pool_id=vip['pool_id'])
+        monitors = dict((hm['id'], hm)
+                        for hm in plugin.get_health_monitors(context))
+        for pool in pools:
+            for hm_status in pool.get('health_monitors_status', []):
+                hm = monitors.get(hm_status['monitor_id'])
+                if hm is None:
+                    continue
+                key = (hm['id'], pool['id'])
+                desired[MONITORS][key] = _Desired(
+                    MONITORS, key, hm,
+                    driver._prepare_healthmonitor_for_creation(hm,
+                                                               pool['id']),
+                    hm_status['status'], pool_id=pool['id'])
+        return desired
+
+    def _device_state(self, client):
+        actual = {}
+        for kind in KINDS:
+            items = (item for _key, item in
+                     client.retrieve_collection(None, kind, kind))
+            if kind == MONITORS:
+                actual[kind] = dict(((item['id'], item['pool_id']), item)
+                                    for item in items)
+            else:
+                actual[kind] = dict((item['id'], item) for item in items)
+        return actual
+
+    def _diff(self, desired, actual):
+        creates, updates, deletes, repaired = [], [], [], []
+        busy_pools = set(key for key, entry in desired[POOLS].items()
+                         if entry.status in PENDING_STATUSES)
+        for kind in KINDS:
+            wanted = desired[kind]
+            present = actual[kind]
+            for key, entry in wanted.items():
+                if (entry.status in PENDING_STATUSES or
+                        entry.pool_id in busy_pools):
+                    continue
+                item = present.get(key)
+                if item is None:
+                    creates.append(entry)
+                elif (content_hash(entry.body) !=
+                      content_hash(item, entry.body.keys())):
+                    updates.append(entry)
+                elif entry.status == constants.ERROR:
+                    repaired.append(entry)
+            for key, item in present.items():
+                if key not in wanted:
+                    deletes.append((kind, key, item))
+        return creates, updates, deletes, repaired
+
+    def _apply(self, context, client, creates, updates, deletes,
+               update_status=True):
+        failures = []
+        workers = eventlet.GreenPool(self.concurrency)
+
+        def run(func, *args):
+            try:
+                func(*args)
+            except Exception:
+                LOG.exception(_("Reconciliation step failed"))
+                failures.append(args)
+
+        # each kind is a phase so children never precede their parent
+        for kind in reversed(KINDS):
+            for item_kind, key, item in deletes:
+                if item_kind == kind:
+                    workers.spawn_n(run, self._remove, client, kind, key, item)
+            workers.waitall()
+        for kind in KINDS:
+            for entry in creates:
+                if entry.kind == kind:
+                    workers.spawn_n(run, self._create, context, client, entry,
+                                    update_status)
+            for entry in updates:
+                if entry.kind == kind:
+                    workers.spawn_n(run, self._update, context, client, entry,
+                                    update_status)
+            workers.waitall()
+        return len(failures)
+
+    def _create(self, context, client, entry, update_status=True):
+        driver = self.driver
+        kind = entry.kind
+        if kind == POOLS:
+            body = driver._build_pool(context, entry.obj)
+        elif kind == VIPS:
+            body = driver._build_vip(context, entry.obj)
+        else:
+            body = entry.body
+        path = kind
+        if kind == MONITORS:
+            path = "%s/%s/%s" % (POOLS, entry.pool_id, MONITORS)
+        self._push(context, entry, update_status, self._create_resource,
+                   client, entry.tenant_id, path, OBJECT_NAMES[kind], body)
+        if kind == POOLS:
+            driver.snat_index.acquire(entry.tenant_id,
+                                      entry.obj['subnet_id'], entry.key)
+
+    def _update(self, context, client, entry, update_status=True):
+        driver = self.driver
+        kind = entry.kind
+        obj = entry.obj
+        if kind == POOLS:
+            body = driver._prepare_pool_for_update(obj)
+        elif kind == VIPS:
+            body = driver._prepare_vip_for_update(obj)
+        elif kind == MEMBERS:
+            body = driver._prepare_member_for_update(obj)
+        else:
+            body = driver._prepare_healthmonitor_for_update(obj)
+        path = "%s/%s" % (kind, obj['id'])
+        self._push(context, entry, update_status, client.update_resource,
+                   entry.tenant_id, path, OBJECT_NAMES[kind], body)
+
+    def _create_resource(self, client, tenant_id, path, name, body):
+        try:
+            client.create_resource(tenant_id, path, name, body)
+        except bg_client.BGException as e:
+            # created by the driver after the device was read
+            if e.status != 409:
+                raise
+
+    def _remove(self, client, kind, key, item):
+        if kind == MONITORS:
+            path = "%s/%s/%s/%s" % (POOLS, key[1], MONITORS, key[0])
+        else:
+            path = "%s/%s" % (kind, key)
+        try:
+            client.remove_resource(item.get('tenant_id'), path)
+        except bg_client.BGException as e:
+            # removed by the driver after the device was read
+            if e.status != 404:
+                raise
+
+    def _push(self, context, entry, update_status, func, *args):
+        try:
+            func(*args)
+        except bg_client.BGException:
+            if update_status:
+                self._set_status(context, entry, constants.ERROR)
+            raise
+        # INACTIVE comes from the health poller and is kept
+        if update_status and entry.status in UNSETTLED_STATUSES:
+            self._set_status(context, entry, constants.ACTIVE)
+
+    def _set_status(self, context, entry, status):
+        plugin = self.driver.plugin
+        if entry.kind == MONITORS:
+            plugin.update_pool_health_monitor(context, entry.key[0],
+                                              entry.pool_id, status, "")
+        else:
+            plugin.update_status(context, MODELS[entry.kind], entry.key,
+                                 status)
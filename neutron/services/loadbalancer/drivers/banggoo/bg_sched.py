@@ -0,0 +1,144 @@
+import collections
+import threading
+import time
+
+import eventlet
+from eventlet import event
+
+
+class _Waiter(object):
+
+    def __init__(self, start, cost):
+        self.start = start
+        self.cost = cost
+        self.queued = time.time()
+        self.ready = event.Event()
+
+
+class _Tenant(object):
+
+    def __init__(self, weight, tokens):
+        self.weight = weight
+        self.tokens = tokens
+        self.refilled = time.time()
+        # virtual time the tenant's last queued request finishes at
+        self.finish = 0.0
+        self.waiting = collections.deque()
+        self.admitted = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+
+
+class FairScheduler(object):
+
+    """Admits device calls per tenant in weighted fair order.
+
+    At most ``max_in_flight`` calls run at once (0 for no limit). Waiting
+    calls are admitted by start-time fair queueing: each call is tagged
+    with a virtual start time that advances by ``cost / weight`` per call
+    of its tenant, and the call with the smallest tag goes first, so a
+    tenant with a long queue cannot starve one sending a single request.
+    Each tenant also has a token bucket refilled at ``rate`` calls per
+    second up to ``burst`` (a rate of 0 disables it); a call costs one
+    token per object it carries, so bulk requests drain the bucket faster.
+    """
+
+    def __init__(self, max_in_flight=0, rate=0, burst=1, weights=None):
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.weights = weights or {}
+        self._lock = threading.Lock()
+        self._tenants = {}
+        # tenants with waiting calls
+        self._busy = set()
+        self._vtime = 0.0
+        self._in_flight = 0
+        self._timer = None
+
+    def acquire(self, tenant_id, cost=1):
+        """Wait until a call of tenant_id may be sent.
+
+        Every acquire must be followed by a release once the call is done.
+        """
+        with self._lock:
+            tenant = self._tenant(tenant_id or '')
+            start = max(self._vtime, tenant.finish)
+            tenant.finish = start + float(cost) / tenant.weight
+            waiter = _Waiter(start, cost)
+            tenant.waiting.append(waiter)
+            self._busy.add(tenant)
+            self._dispatch()
+        waiter.ready.wait()
+
+    def release(self):
+        """Give back the admission of a finished call."""
+        with self._lock:
+            self._in_flight -= 1
+            self._dispatch()
+
+    def stats(self):
+        """Return admission counters, per tenant under 'tenants'."""
+        with self._lock:
+            tenants = dict(
+                (tenant_id, {'queued': len(tenant.waiting),
+                             'admitted': tenant.admitted,
+                             'wait_seconds': tenant.wait_seconds,
+                             'max_wait': tenant.max_wait})
+                for tenant_id, tenant in self._tenants.items())
+            return {'in_flight': self._in_flight, 'tenants': tenants}
+
+    def _tenant(self, tenant_id):
+        tenant = self._tenants.get(tenant_id)
+        if tenant is None:
+            weight = float(self.weights.get(tenant_id, 1.0))
+            tenant = self._tenants[tenant_id] = _Tenant(weight, self.burst)
+        return tenant
+
+    def _token_wait(self, tenant, now):
+        """Return the seconds until tenant has a token, 0 if it has one."""
+        if self.rate <= 0:
+            return 0
+        tenant.tokens = min(self.burst, tenant.tokens +
+                            (now - tenant.refilled) * self.rate)
+        tenant.refilled = now
+        if tenant.tokens >= 1:
+            return 0
+        return (1 - tenant.tokens) / self.rate
+
+    def _dispatch(self):
+        # called with the lock held
+        now = time.time()
+        while (not self.max_in_flight or
+               self._in_flight < self.max_in_flight):
+            best = None
+            delay = None
+            for tenant in self._busy:
+                wait = self._token_wait(tenant, now)
+                if wait:
+                    delay = wait if delay is None else min(delay, wait)
+                elif (best is None or
+                      tenant.waiting[0].start < best.waiting[0].start):
+                    best = tenant
+            if best is None:
+                if delay is not None and self._timer is None:
+                    self._timer = eventlet.spawn_after(delay, self._wake)
+                return
+            waiter = best.waiting.popleft()
+            if not best.waiting:
+                self._busy.discard(best)
+            if self.rate > 0:
+                # may go negative: a bulk call is paid off before the next
+                best.tokens -= waiter.cost
+            self._vtime = waiter.start
+            self._in_flight += 1
+            waited = now - waiter.queued
+            best.admitted += 1
+            best.wait_seconds += waited
+            best.max_wait = max(best.max_wait, waited)
+            waiter.ready.send()
+
+    def _wake(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch()
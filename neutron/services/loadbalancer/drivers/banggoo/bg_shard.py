@@ -0,0 +1,115 @@
+import bisect
+import hashlib
+
+# virtual nodes per unit of weight, enough to keep the spread even
+REPLICAS = 100
+
+
+def parse_endpoints(entries):
+    """Parse ``uri[+uri...][|weight]`` entries into a list of (uris,
+    weight); several uris form a device group, the first is active."""
+    endpoints = []
+    for entry in entries:
+        entry = entry.strip()
+        if not entry:
+            continue
+        uris, sep, weight = entry.partition('|')
+        endpoints.append(([uri.strip() for uri in uris.split('+')],
+                          float(weight) if sep else 1.0))
+    return endpoints
+
+
+class HashRing(object):
+
+    """Consistent hash ring placing keys on weighted nodes.
+
+    Each node owns ``REPLICAS * weight`` points of the ring, so adding or
+    removing a node only moves the keys of the points it gains or loses.
+    """
+
+    def __init__(self, nodes):
+        points = []
+        for node, weight in nodes:
+            for i in range(max(int(REPLICAS * weight), 1)):
+                points.append((self._hash('%s-%d' % (node, i)), node))
+        points.sort()
+        self._hashes = [point[0] for point in points]
+        self._nodes = [point[1] for point in points]
+
+    def _hash(self, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return int(hashlib.md5(key).hexdigest()[:8], 16)
+
+    def get_node(self, key):
+        """Return the node owning key."""
+        idx = bisect.bisect(self._hashes, self._hash(key))
+        return self._nodes[idx % len(self._nodes)]
+
+
+class ShardedClient(object):
+
+    """Routes BGClient calls to the Control Center owning the tenant.
+
+    Offers the resource operations of BGClient; every call is sent to the
+    device group the tenant id hashes to, so all objects of a tenant live
+    on the same device or pair of devices.
+    """
+
+    def __init__(self, clients):
+        """clients is a list of (DeviceGroup, weight) pairs."""
+        self.clients = [client for client, _weight in clients]
+        # the BGClient of every device of every group
+        self.endpoints = [endpoint for client in self.clients
+                          for endpoint in client.clients]
+        self._groups = dict((client.service_uri, client)
+                            for client in self.clients)
+        self._by_uri = dict((endpoint.service_uri, endpoint)
+                            for endpoint in self.endpoints)
+        self._ring = HashRing([(client.service_uri, weight)
+                               for client, weight in clients])
+
+    def client_for(self, tenant_id):
+        """Return the DeviceGroup owning tenant_id."""
+        return self._groups[self._ring.get_node(tenant_id)]
+
+    def client_by_uri(self, uri):
+        """Return the BGClient of the endpoint uri, or None."""
+        return self._by_uri.get(uri)
+
+    def create_resource(self, tenant_id, *args, **kwargs):
+        return self.client_for(tenant_id).create_resource(tenant_id, *args,
+                                                          **kwargs)
+
+    def retrieve_resource(self, tenant_id, *args, **kwargs):
+        return self.client_for(tenant_id).retrieve_resource(tenant_id, *args,
+                                                            **kwargs)
+
+    def retrieve_collection(self, tenant_id, *args, **kwargs):
+        return self.client_for(tenant_id).retrieve_collection(tenant_id,
+                                                              *args,
+                                                              **kwargs)
+
+    def update_resource(self, tenant_id, *args, **kwargs):
+        return self.client_for(tenant_id).update_resource(tenant_id, *args,
+                                                          **kwargs)
+
+    def remove_resource(self, tenant_id, *args, **kwargs):
+        return self.client_for(tenant_id).remove_resource(tenant_id, *args,
+                                                          **kwargs)
+
+    def bulk_create_resources(self, tenant_id, *args, **kwargs):
+        return self.client_for(tenant_id).bulk_create_resources(
+            tenant_id, *args, **kwargs)
+
+    def bulk_remove_resources(self, tenant_id, *args, **kwargs):
+        return self.client_for(tenant_id).bulk_remove_resources(
+            tenant_id, *args, **kwargs)
+
+    def failed_bulk_items(self, resp_dict, ids):
+        return self.clients[0].failed_bulk_items(resp_dict, ids)
+
+    def pool_stats(self):
+        """Return the connection pool counters of every endpoint."""
+        return dict((endpoint.service_uri, endpoint.pool_stats())
+                    for endpoint in self.endpoints)
@@ -0,0 +1,136 @@
+import sys
+import threading
+
+from eventlet import event
+
+
+class SnatPortIndex(object):
+
+    """Maps (tenant_id, subnet_id) to its SNAT port and the pools using it.
+
+    The index is loaded once from neutron and then kept current by the
+    driver's own pool operations. Until it is loaded every lookup misses,
+    so callers fall back to querying neutron.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ports = {}
+        self._pools = {}
+        self.loaded = False
+
+    def load(self, ports, pools):
+        """Rebuild the index.
+
+        ``ports`` yields (tenant_id, subnet_id, port) and ``pools`` yields
+        (tenant_id, subnet_id, pool_id) tuples.
+        """
+        port_map = {}
+        pool_map = {}
+        for tenant_id, subnet_id, port in ports:
+            port_map[(tenant_id, subnet_id)] = port
+        for tenant_id, subnet_id, pool_id in pools:
+            pool_map.setdefault((tenant_id, subnet_id), set()).add(pool_id)
+        with self._lock:
+            self._ports = port_map
+            self._pools = pool_map
+            self.loaded = True
+
+    def get(self, tenant_id, subnet_id):
+        """Return the SNAT port of a subnet, or None if it is not known."""
+        with self._lock:
+            return self._ports.get((tenant_id, subnet_id))
+
+    def add_port(self, tenant_id, subnet_id, port):
+        with self._lock:
+            if self.loaded:
+                self._ports[(tenant_id, subnet_id)] = port
+
+    def pop_port(self, tenant_id, subnet_id):
+        with self._lock:
+            self._pools.pop((tenant_id, subnet_id), None)
+            return self._ports.pop((tenant_id, subnet_id), None)
+
+    def acquire(self, tenant_id, subnet_id, pool_id):
+        """Record that pool_id uses the SNAT port of its subnet."""
+        with self._lock:
+            if self.loaded:
+                key = (tenant_id, subnet_id)
+                self._pools.setdefault(key, set()).add(pool_id)
+
+    def release(self, tenant_id, subnet_id, pool_id):
+        """Drop pool_id from its subnet.
+
+        Returns the number of pools still using the SNAT port, or None when
+        the index cannot tell.
+        """
+        with self._lock:
+            if not self.loaded:
+                return None
+            pools = self._pools.get((tenant_id, subnet_id), set())
+            pools.discard(pool_id)
+            return len(pools)
+
+
+class _Flight(object):
+
+    def __init__(self, shared):
+        self.shared = shared
+        self.done = event.Event()
+
+
+class SingleFlight(object):
+
+    """Runs one operation per key at a time.
+
+    A shared call made while a shared call of the same key is in flight
+    does not run: it waits and returns the result of that call, or raises
+    its exception. Any other call waits for the call in flight to finish
+    and then runs on its own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> _Flight in progress
+        self._flights = {}
+        self.joined = 0
+
+    def do(self, key, func, *args):
+        """Call func(*args), or join the shared call of key in flight."""
+        return self._run(key, True, func, args)
+
+    def exclusive(self, key, func, *args):
+        """Call func(*args) once no other call of key is in flight."""
+        return self._run(key, False, func, args)
+
+    def _run(self, key, shared, func, args):
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = _Flight(shared)
+                    break
+                join = shared and flight.shared
+                if join:
+                    self.joined += 1
+            if join:
+                return flight.done.wait()
+            try:
+                flight.done.wait()
+            except Exception:
+                # the failure belongs to the callers of that flight
+                pass
+        try:
+            result = func(*args)
+        except Exception:
+            exc_info = sys.exc_info()
+            self._land(key)
+            flight.done.send_exception(*exc_info)
+            raise
+        self._land(key)
+        flight.done.send(result)
+        return result
+
+    def _land(self, key):
+        with self._lock:
+            del self._flights[key]
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from neutron.openstack.common import log as logging
+from neutron.openstack.common import loopingcall
+from neutron.services.loadbalancer.drivers.banggoo import bg_client
+
+LOG = logging.getLogger(__name__)
+
+SCOPE_ALL = 'all'
+SCOPE_TENANT = 'tenant'
+
+
+class StatsRefresher(object):
+
+    """Keeps a pool statistics cache filled from bulk device requests.
+
+    ``fetch(tenant_id)`` must return a dict of pool_id -> statistics for
+    every pool of the tenant, or of every tenant when called with None.
+    With the ``tenant`` scope one request per tenant that asked for
+    statistics is sent each cycle, until a refresh finds no pools for the
+    tenant; with the ``all`` scope a single one.
+    Every refreshed sample is also recorded in ``history``, if given.
+    """
+
+    def __init__(self, cache, fetch, interval, scope=SCOPE_TENANT,
+                 history=None):
+        self.cache = cache
+        self.history = history
+        self.fetch = fetch
+        self.interval = interval
+        self.scope = scope
+        self._tenants = set()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def watch(self, tenant_id):
+        """Include the pools of tenant_id in the following refreshes."""
+        with self._lock:
+            self._tenants.add(tenant_id)
+
+    def start(self):
+        self._timer = loopingcall.FixedIntervalLoopingCall(self.refresh)
+        self._timer.start(interval=self.interval, initial_delay=self.interval)
+
+    def stop(self):
+        if self._timer:
+            self._timer.stop()
+            self._timer = None
+
+    def refresh(self):
+        if self.scope == SCOPE_ALL:
+            scopes = [None]
+        else:
+            with self._lock:
+                scopes = list(self._tenants)
+        for tenant_id in scopes:
+            try:
+                pool_stats = self.fetch(tenant_id)
+            except bg_client.BGException:
+                LOG.warn(_("Bulk statistics refresh failed for tenant %s"),
+                         tenant_id or 'all')
+                continue
+            except Exception:
+                # never let the looping call die on an unexpected reply
+                LOG.exception(_("Unexpected error refreshing statistics"))
+                continue
+            if not pool_stats and tenant_id is not None:
+                # the tenant has no pools left, stats() watches it again
+                # once it asks for statistics of a new one
+                with self._lock:
+                    self._tenants.discard(tenant_id)
+                continue
+            self._store(pool_stats)
+
+    def prime(self):
+        """Fill the cache with the statistics of every pool at once."""
+        self._store(self.fetch(None))
+
+    def _store(self, pool_stats):
+        now = time.time()
+        for pool_id, stats in pool_stats.items():
+            self.cache.set(pool_id, stats)
+            if self.history is not None:
+                self.history.record(pool_id, stats, now)
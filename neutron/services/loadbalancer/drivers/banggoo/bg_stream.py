@@ -0,0 +1,114 @@
+import codecs
+import json
+
+WHITESPACE = ' \t\n\r'
+
+
+class _Buffer(object):
+
+    """Text decoded from byte chunks, holding only what is not consumed."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json = json.JSONDecoder()
+        self.text = u''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read the next chunk, return False at the end of the body."""
+        if self.eof:
+            return False
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.eof = True
+            chunk = b''
+        self.text = (self.text[self.pos:] +
+                     self.decoder.decode(chunk, final=self.eof))
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next character after whitespace, '' at the end."""
+        while True:
+            while (self.pos < len(self.text) and
+                   self.text[self.pos] in WHITESPACE):
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars or not char:
+            raise ValueError("Expected %r at %r" % (chars, char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.text, self.pos)
+            except ValueError:
+                # incomplete value, unless the body is over
+                if not self.fill():
+                    raise
+                continue
+            # a number or literal may continue in the next chunk
+            if end < len(self.text) or not self.fill():
+                self.pos = end
+                return value
+
+
+def _members(buf, close):
+    """Yield (key, value) of an object or (None, value) of an array whose
+    opening bracket was consumed, up to the closing one."""
+    if buf.peek() == close:
+        buf.pos += 1
+        return
+    while True:
+        key = None
+        if close == '}':
+            key = buf.value()
+            buf.expect(':')
+        yield key, buf.value()
+        if buf.expect(',' + close) == close:
+            return
+
+
+def iter_collection(chunks, collection):
+    """Yield the items of a collection from a JSON body, one at a time.
+
+    ``chunks`` yields the body in pieces of bytes. The body is
+    ``{"<collection>": [...]}``, ``{"<collection>": {...}}`` or a bare
+    array. Items of an array are yielded as (None, item), members of an
+    object as (key, value). Only the item being decoded and one chunk are
+    held in memory, so memory does not grow with the size of the
+    collection. Raises ValueError on a malformed body.
+    """
+    buf = _Buffer(chunks)
+    if buf.expect('{[') == '[':
+        for item in _members(buf, ']'):
+            yield item
+        return
+    if buf.peek() == '}':
+        return
+    while True:
+        key = buf.value()
+        buf.expect(':')
+        char = buf.peek()
+        if char in ('{', '['):
+            buf.pos += 1
+            # other containers are walked through item by item as well
+            for item in _members(buf, '}' if char == '{' else ']'):
+                if key == collection:
+                    yield item
+        else:
+            buf.value()
+        if buf.expect(',}') == '}':
+            return
@@ -0,0 +1,167 @@
+import functools
+import random
+import threading
+import time
+import uuid
+
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+TRACE_HEADER = 'X-Trace-ID'
+
+# green thread local once eventlet has patched threading
+_local = threading.local()
+
+
+class _Trace(object):
+
+    def __init__(self, name, sampled, tags):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex
+        self.sampled = sampled
+        self.tags = tags
+        self.started = time.time()
+        # phase -> seconds spent in it
+        self.phases = {}
+
+
+class _Operation(object):
+
+    def __init__(self, tracer, name, tags):
+        self.tracer = tracer
+        self.name = name
+        self.tags = tags
+        self.trace = None
+
+    def __enter__(self):
+        if getattr(_local, 'trace', None) is not None:
+            # nested operation, part of the enclosing trace
+            return None
+        tracer = self.tracer
+        sampled = (tracer.sample_rate > 0 and
+                   random.random() < tracer.sample_rate)
+        self.trace = _local.trace = _Trace(self.name, sampled, self.tags)
+        return self.trace
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.trace is not None:
+            _local.trace = None
+            self.tracer._finish(self.trace, exc_type)
+        return False
+
+
+class _NoOperation(object):
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_NO_OPERATION = _NoOperation()
+
+
+class span(object):
+
+    """Adds the time spent in the block to a phase of the current trace.
+
+    Costs one thread local lookup when no sampled trace is running.
+    """
+
+    __slots__ = ('phase', 'trace', 'started')
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        trace = getattr(_local, 'trace', None)
+        if trace is not None and trace.sampled:
+            self.trace = trace
+            self.started = time.time()
+        else:
+            self.trace = None
+
+    def __exit__(self, exc_type, exc_value, tb):
+        trace = self.trace
+        if trace is not None:
+            trace.phases[self.phase] = (trace.phases.get(self.phase, 0.0) +
+                                        time.time() - self.started)
+        return False
+
+
+def spanned(phase):
+    """Decorator recording every call of a function as a phase."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced(name):
+    """Decorator tracing a driver method taking a context as operation."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, context, *args, **kwargs):
+            with self.tracer.operation(name, tenant_id=context.tenant_id):
+                return func(self, context, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_id():
+    """Return the id of the trace running in this thread, if any."""
+    trace = getattr(_local, 'trace', None)
+    return trace.trace_id if trace is not None else None
+
+
+class Tracer(object):
+
+    """Times driver operations and the phases they spend their time in.
+
+    Every operation is timed while tracing is enabled, and operations
+    taking ``slow_threshold`` seconds or more are logged as a JSON record.
+    A ``sample_rate`` share of the operations also records its phases
+    (network lookups, SNAT handling, serialization, the HTTP call, status
+    writes), which go into that record and are logged at debug level.
+    With both settings at 0 operations are not traced at all.
+    """
+
+    def __init__(self, sample_rate=0.0, slow_threshold=0.0):
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.enabled = sample_rate > 0 or slow_threshold > 0
+
+    def operation(self, name, **tags):
+        """Return a context manager tracing one operation."""
+        if not self.enabled:
+            return _NO_OPERATION
+        return _Operation(self, name, tags)
+
+    def _finish(self, trace, exc_type):
+        seconds = time.time() - trace.started
+        slow = self.slow_threshold > 0 and seconds >= self.slow_threshold
+        if not (slow or trace.sampled):
+            return
+        record = {'operation': trace.name,
+                  'trace_id': trace.trace_id,
+                  'seconds': round(seconds, 6),
+                  'error': exc_type.__name__ if exc_type else None}
+        record.update(trace.tags)
+        if trace.sampled:
+            phases = dict((phase, round(secs, 6))
+                          for phase, secs in trace.phases.items())
+            phases['other'] = round(max(seconds - sum(
+                trace.phases.values()), 0.0), 6)
+            record['phases'] = phases
+        if slow:
+            LOG.warn(_("Slow Banggoo operation: %s"),
+                     jsonutils.dumps(record, sort_keys=True))
+        else:
+            LOG.debug(_("Banggoo operation trace: %s"),
+                      jsonutils.dumps(record, sort_keys=True))
@@ -1,12 +1,33 @@
+import time
+
 import bg_conf
+import eventlet
+from eventlet import event
 from oslo.config import cfg
+from six.moves.urllib import parse as urlparse
 
 from neutron.api.v2 import attributes
+from neutron import context as n_context
 from neutron.db.loadbalancer import loadbalancer_db
 from neutron.openstack.common import log as logging
 from neutron.plugins.common import constants
 from neutron.services.loadbalancer.drivers import abstract_driver
+from neutron.services.loadbalancer.drivers.banggoo import bg_async
+from neutron.services.loadbalancer.drivers.banggoo import bg_batch
+from neutron.services.loadbalancer.drivers.banggoo import bg_cache
 from neutron.services.loadbalancer.drivers.banggoo import bg_client
+from neutron.services.loadbalancer.drivers.banggoo import bg_coalesce
+from neutron.services.loadbalancer.drivers.banggoo import bg_group
+from neutron.services.loadbalancer.drivers.banggoo import bg_health
+from neutron.services.loadbalancer.drivers.banggoo import bg_history
+from neutron.services.loadbalancer.drivers.banggoo import bg_journal
+from neutron.services.loadbalancer.drivers.banggoo import bg_metrics
+from neutron.services.loadbalancer.drivers.banggoo import bg_reconcile
+from neutron.services.loadbalancer.drivers.banggoo import bg_sched
+from neutron.services.loadbalancer.drivers.banggoo import bg_shard
+from neutron.services.loadbalancer.drivers.banggoo import bg_snat
+from neutron.services.loadbalancer.drivers.banggoo import bg_stats
+from neutron.services.loadbalancer.drivers.banggoo import bg_trace
 from neutron.common import exceptions as qexception
 from neutron.extensions import loadbalancer
 
@@ -21,9 +42,11 @@ POOLMEMBER_RESOURCE = 'member'
 MONITORS_RESOURCE = 'healthmonitors'
 MONITOR_RESOURCE = 'healthmonitor'
 POOLSTATS_RESOURCE = 'statistics'
+MEMBER_STATUS_RESOURCE = 'members/status'
 PROV_SEGMT_ID = 'provider:segmentation_id'
 PROV_NET_TYPE = 'provider:network_type'
 DRIVER_NAME = 'banggoo'
+SNATPORT_PREFIX = '_lb-snatport-'
 
 BG_CONF = bg_conf.cfgparse()
 
@@ -37,6 +60,226 @@ driver_opts = [
     cfg.StrOpt('adc_password',
                default=BG_CONF.get('adc_password'),
                help=_('vDirect user password.')),
+    cfg.StrOpt('adc_auth_mode',
+               default=BG_CONF.get('adc_auth_mode', bg_client.AUTH_BASIC),
+               help=_('"basic" sends the credentials with every request, '
+                      '"token" logs in once and reuses a session token.')),
+    cfg.IntOpt('adc_token_refresh_margin',
+               default=int(BG_CONF.get(
+                   'adc_token_refresh_margin',
+                   bg_client.DEFAULT_TOKEN_REFRESH_MARGIN)),
+               help=_('Seconds before expiry a session token is renewed.')),
+    cfg.IntOpt('adc_token_lifetime',
+               default=int(BG_CONF.get('adc_token_lifetime',
+                                       bg_client.DEFAULT_TOKEN_LIFETIME)),
+               help=_('Lifetime assumed for session tokens the Control '
+                      'Center returns without expires_in.')),
+    cfg.ListOpt('adc_addresses',
+                default=[uri for uri in
+                         BG_CONF.get('adc_addresses', '').split(',') if uri],
+                help=_('Control Center URIs to spread tenants over, each '
+                       'optionally followed by |weight. uri+uri makes an '
+                       'active/standby device group. Overrides '
+                       'adc_address.')),
+    cfg.IntOpt('http_pool_connections',
+               default=int(BG_CONF.get('http_pool_connections',
+                                       bg_client.DEFAULT_POOL_CONNECTIONS)),
+               help=_('Number of connection pools to cache.')),
+    cfg.IntOpt('http_pool_maxsize',
+               default=int(BG_CONF.get('http_pool_maxsize',
+                                       bg_client.DEFAULT_POOL_MAXSIZE)),
+               help=_('Maximum number of keep-alive connections kept per '
+                      'Control Center host.')),
+    cfg.IntOpt('http_pool_idle_timeout',
+               default=int(BG_CONF.get('http_pool_idle_timeout',
+                                       bg_client.DEFAULT_POOL_IDLE_TIMEOUT)),
+               help=_('Seconds a connection pool may stay unused before it '
+                      'is closed and reopened. 0 keeps it forever.')),
+    cfg.FloatOpt('http_connect_timeout',
+                 default=float(BG_CONF.get('http_connect_timeout',
+                                           bg_client.DEFAULT_CONNECT_TIMEOUT)),
+                 help=_('Seconds to wait for a connection to the Control '
+                        'Center.')),
+    cfg.DictOpt('http_read_timeouts',
+                default=bg_conf.getdict(BG_CONF, 'http_read_timeouts',
+                                        {'GET': '30', 'POST': '60',
+                                         'PUT': '60', 'DELETE': '60'}),
+                help=_('Seconds to wait for a response, per HTTP method, '
+                       'e.g. GET:30,POST:60,PUT:60,DELETE:60.')),
+    cfg.IntOpt('breaker_failure_threshold',
+               default=int(BG_CONF.get('breaker_failure_threshold', 5)),
+               help=_('Consecutive connection or 5xx failures after which '
+                      'calls to a Control Center fail fast. 0 disables the '
+                      'circuit breaker.')),
+    cfg.FloatOpt('breaker_reset_timeout',
+                 default=float(BG_CONF.get('breaker_reset_timeout', 30)),
+                 help=_('Seconds an open circuit waits before letting a '
+                        'probe request through.')),
+    cfg.IntOpt('http_max_retries',
+               default=int(BG_CONF.get('http_max_retries', 2)),
+               help=_('Retries of failed GET, PUT and DELETE requests.')),
+    cfg.FloatOpt('http_retry_backoff',
+                 default=float(BG_CONF.get('http_retry_backoff', 0.5)),
+                 help=_('Base of the jittered exponential backoff between '
+                        'retries, in seconds.')),
+    cfg.IntOpt('max_in_flight',
+               default=int(BG_CONF.get('max_in_flight', 0)),
+               help=_('Maximum number of concurrent calls to a Control '
+                      'Center, admitted in weighted fair order across '
+                      'tenants. 0 disables the limit.')),
+    cfg.FloatOpt('tenant_rate_limit',
+                 default=float(BG_CONF.get('tenant_rate_limit', 0)),
+                 help=_('Device calls per second allowed to each tenant; '
+                        'bulk calls count once per object. 0 disables '
+                        'rate limiting.')),
+    cfg.IntOpt('tenant_burst',
+               default=int(BG_CONF.get('tenant_burst', 20)),
+               help=_('Device calls a tenant may send at once on top of '
+                      'tenant_rate_limit.')),
+    cfg.DictOpt('tenant_weights',
+                default=bg_conf.getdict(BG_CONF, 'tenant_weights', {}),
+                help=_('Fair queueing weight per tenant id, e.g. '
+                       'TENANT_ID:2. Tenants not listed have weight 1.')),
+    cfg.IntOpt('device_group_resync_delay',
+               default=int(BG_CONF.get('device_group_resync_delay',
+                                       bg_group.DEFAULT_RESYNC_DELAY)),
+               help=_('Seconds after a standby Control Center of a device '
+                      'group failed a write until it is resynced.')),
+    cfg.StrOpt('request_compression',
+               default=BG_CONF.get('request_compression',
+                                   bg_client.COMPRESSION_NONE),
+               help=_('Encoding of request bodies of at least '
+                      'compression_threshold bytes: none, gzip or '
+                      'deflate.')),
+    cfg.DictOpt('endpoint_compression',
+                default=bg_conf.getdict(BG_CONF, 'endpoint_compression', {}),
+                help=_('request_compression per Control Center host, e.g. '
+                       '192.168.4.201:gzip.')),
+    cfg.IntOpt('compression_threshold',
+               default=int(BG_CONF.get(
+                   'compression_threshold',
+                   bg_client.DEFAULT_COMPRESSION_THRESHOLD)),
+               help=_('Smallest request body, in bytes, that is '
+                      'compressed.')),
+    cfg.BoolOpt('accept_compressed_responses',
+                default=bg_conf.getbool(BG_CONF,
+                                        'accept_compressed_responses', True),
+                help=_('Let the Control Center send gzip or deflate encoded '
+                       'responses.')),
+    cfg.BoolOpt('async_mode',
+                default=bg_conf.getbool(BG_CONF, 'async_mode'),
+                help=_('Return from API calls with objects left in PENDING_* '
+                       'and push them to the device in the background.')),
+    cfg.IntOpt('async_workers',
+               default=int(BG_CONF.get('async_workers', 8)),
+               help=_('Number of concurrent background device operations '
+                      'in async mode.')),
+    cfg.BoolOpt('coalesce_updates',
+                default=bg_conf.getbool(BG_CONF, 'coalesce_updates'),
+                help=_('Merge updates of an object queued behind an update '
+                       'in flight and send only the newest state.')),
+    cfg.FloatOpt('member_batch_window',
+                 default=float(BG_CONF.get('member_batch_window', 0)),
+                 help=_('Seconds to gather member creations and removals '
+                        'into one bulk device request. 0 disables '
+                        'batching.')),
+    cfg.IntOpt('member_batch_size',
+               default=int(BG_CONF.get('member_batch_size', 100)),
+               help=_('Maximum number of members sent in one bulk '
+                      'request.')),
+    cfg.BoolOpt('cascade_pool_delete',
+                default=bg_conf.getbool(BG_CONF, 'cascade_pool_delete'),
+                help=_('Remove a pool together with its members and health '
+                       'monitors in one device request and one database '
+                       'transaction. The Control Center must support '
+                       'DELETE pools/<id>?cascade=true.')),
+    cfg.StrOpt('journal_file',
+               default=BG_CONF.get('journal_file'),
+               help=_('File recording device changes before they are sent. '
+                      'Changes a restart interrupted are replayed or rolled '
+                      'back from it on startup. Each neutron-server process '
+                      'needs its own file.')),
+    cfg.BoolOpt('reconcile_on_startup',
+                default=bg_conf.getbool(BG_CONF, 'reconcile_on_startup'),
+                help=_('Reconcile the Control Centers with neutron when the '
+                       'driver starts.')),
+    cfg.IntOpt('reconcile_interval',
+               default=int(BG_CONF.get('reconcile_interval', 0)),
+               help=_('Seconds between reconciliations of the Control '
+                      'Centers with neutron. 0 disables periodic runs.')),
+    cfg.IntOpt('reconcile_concurrency',
+               default=int(BG_CONF.get('reconcile_concurrency', 8)),
+               help=_('Device requests in flight while applying a '
+                      'reconciliation.')),
+    cfg.IntOpt('member_status_interval',
+               default=int(BG_CONF.get('member_status_interval', 0)),
+               help=_('Seconds between bulk polls of member health from '
+                      'the Control Centers, written to the member status. '
+                      '0 disables polling.')),
+    cfg.FloatOpt('trace_sample_rate',
+                 default=float(BG_CONF.get('trace_sample_rate', 0)),
+                 help=_('Share of driver operations, between 0 and 1, whose '
+                        'time per phase is recorded and logged at debug '
+                        'level.')),
+    cfg.FloatOpt('slow_operation_threshold',
+                 default=float(BG_CONF.get('slow_operation_threshold', 0)),
+                 help=_('Seconds after which a driver operation is logged '
+                        'as slow, with its phases if it was sampled. 0 '
+                        'disables the slow operation log.')),
+    cfg.BoolOpt('warm_up',
+                default=bg_conf.getbool(BG_CONF, 'warm_up'),
+                help=_('Open connections, log in and prefill the statistics '
+                       'and lookup caches in the background when the '
+                       'driver starts.')),
+    cfg.IntOpt('warm_up_connections',
+               default=int(BG_CONF.get('warm_up_connections', 2)),
+               help=_('Connections opened per Control Center by the '
+                      'warm-up.')),
+    cfg.StrOpt('metrics_textfile',
+               default=BG_CONF.get('metrics_textfile'),
+               help=_('File the request metrics are periodically written '
+                      'to in Prometheus text format, for the node exporter '
+                      'textfile collector.')),
+    cfg.IntOpt('metrics_interval',
+               default=int(BG_CONF.get('metrics_interval', 15)),
+               help=_('Seconds between writes of the metrics file.')),
+    cfg.IntOpt('lookup_cache_ttl',
+               default=int(BG_CONF.get('lookup_cache_ttl', 300)),
+               help=_('Seconds subnet and network lookups are cached. '
+                      '0 caches them only for the duration of a request.')),
+    cfg.IntOpt('lookup_cache_size',
+               default=int(BG_CONF.get('lookup_cache_size', 1024)),
+               help=_('Maximum number of cached subnets and networks.')),
+    cfg.IntOpt('stats_cache_ttl',
+               default=int(BG_CONF.get('stats_cache_ttl', 0)),
+               help=_('Seconds pool statistics are served from memory. '
+                      '0 fetches them from the device on every call.')),
+    cfg.IntOpt('stats_cache_size',
+               default=int(BG_CONF.get('stats_cache_size', 10000)),
+               help=_('Maximum number of pools kept in the statistics '
+                      'cache.')),
+    cfg.IntOpt('stats_refresh_interval',
+               default=int(BG_CONF.get('stats_refresh_interval', 10)),
+               help=_('Seconds between bulk statistics refreshes of the '
+                      'cache.')),
+    cfg.StrOpt('stats_refresh_scope',
+               default=BG_CONF.get('stats_refresh_scope',
+                                   bg_stats.SCOPE_TENANT),
+               help=_('"tenant" refreshes the tenants that asked for '
+                      'statistics with one request each, "all" fetches '
+                      'every pool in a single request.')),
+    cfg.IntOpt('stats_history_size',
+               default=int(BG_CONF.get('stats_history_size', 0)),
+               help=_('Statistics samples kept per pool to derive rates '
+                      'and peaks from. 0 disables the history.')),
+    cfg.IntOpt('stats_history_pools',
+               default=int(BG_CONF.get('stats_history_pools', 10000)),
+               help=_('Maximum number of pools with a statistics '
+                      'history.')),
+    cfg.IntOpt('stats_history_window',
+               default=int(BG_CONF.get('stats_history_window', 300)),
+               help=_('Seconds of statistics history summarized in the '
+                      'exported metrics.')),
 ]
 
 cfg.CONF.register_opts(driver_opts, "banggoo")
@@ -52,17 +295,285 @@ class BanggooLoadBalancerDriver(abstract_driver.LoadBalancerAbstractDriver):
 
     def __init__(self, plugin):
         self.plugin = plugin
+        self.tracer = bg_trace.Tracer(
+            cfg.CONF.banggoo.trace_sample_rate,
+            cfg.CONF.banggoo.slow_operation_threshold)
         ip = cfg.CONF.banggoo.adc_address
         username = cfg.CONF.banggoo.adc_user
         password = cfg.CONF.banggoo.adc_password
         LOG.error("ip=%s user=%s password=%s" % (cfg.CONF.banggoo.values(), username,password))
-        self.client = bg_client.BGClient(ip, username, password)
+        self.journal = None
+        journal_entries = []
+        if cfg.CONF.banggoo.journal_file:
+            self.journal = bg_journal.Journal(cfg.CONF.banggoo.journal_file)
+            journal_entries = self.journal.load()
+        endpoints = bg_shard.parse_endpoints(cfg.CONF.banggoo.adc_addresses)
+        if not endpoints:
+            endpoints = [([ip], 1.0)]
+        self.client = bg_shard.ShardedClient(
+            [(bg_group.DeviceGroup(
+                [self._create_client(uri, username, password)
+                 for uri in uris],
+                resync=self._resync_device,
+                resync_delay=cfg.CONF.banggoo.device_group_resync_delay),
+              weight)
+             for uris, weight in endpoints])
+        self.workers = None
+        if cfg.CONF.banggoo.async_mode:
+            self.workers = bg_async.OrderedWorkerPool(
+                cfg.CONF.banggoo.async_workers)
+        self.cascade_pool_delete = cfg.CONF.banggoo.cascade_pool_delete
+        self.coalescer = None
+        if cfg.CONF.banggoo.coalesce_updates:
+            self.coalescer = bg_coalesce.UpdateCoalescer()
+        self.member_batcher = None
+        if cfg.CONF.banggoo.member_batch_window > 0:
+            self.member_batcher = bg_batch.OperationBatcher(
+                self._flush_members,
+                cfg.CONF.banggoo.member_batch_window,
+                cfg.CONF.banggoo.member_batch_size)
+        self.lookup_cache = None
+        if cfg.CONF.banggoo.lookup_cache_ttl > 0:
+            self.lookup_cache = bg_cache.TTLCache(
+                cfg.CONF.banggoo.lookup_cache_ttl,
+                cfg.CONF.banggoo.lookup_cache_size)
+        self.snat_index = bg_snat.SnatPortIndex()
+        # SNAT port lookups, creations and removals per (tenant, subnet)
+        self.snat_flights = bg_snat.SingleFlight()
+        eventlet.spawn_n(self._load_snat_index)
+        self.stats_history = None
+        if cfg.CONF.banggoo.stats_history_size > 0:
+            self.stats_history = bg_history.StatsHistory(
+                cfg.CONF.banggoo.stats_history_size,
+                cfg.CONF.banggoo.stats_history_pools)
+        self.stats_cache = None
+        self.stats_refresher = None
+        if cfg.CONF.banggoo.stats_cache_ttl > 0:
+            self.stats_cache = bg_cache.TTLCache(
+                cfg.CONF.banggoo.stats_cache_ttl,
+                cfg.CONF.banggoo.stats_cache_size)
+            self.stats_refresher = bg_stats.StatsRefresher(
+                self.stats_cache, self._fetch_bulk_stats,
+                cfg.CONF.banggoo.stats_refresh_interval,
+                scope=cfg.CONF.banggoo.stats_refresh_scope,
+                history=self.stats_history)
+            self.stats_refresher.start()
+        self.member_status_poller = None
+        if cfg.CONF.banggoo.member_status_interval > 0:
+            self.member_status_poller = bg_health.MemberStatusPoller(
+                self._fetch_member_status,
+                cfg.CONF.banggoo.member_status_interval)
+            self.member_status_poller.start()
+        self.metrics_exporter = None
+        if cfg.CONF.banggoo.metrics_textfile:
+            self.metrics_exporter = bg_metrics.TextfileExporter(
+                cfg.CONF.banggoo.metrics_textfile, self.render_metrics,
+                cfg.CONF.banggoo.metrics_interval)
+            self.metrics_exporter.start()
+        self.reconciler = bg_reconcile.Reconciler(
+            self, cfg.CONF.banggoo.reconcile_concurrency)
+        interval = cfg.CONF.banggoo.reconcile_interval
+        if interval > 0:
+            self.reconciler.start(
+                interval,
+                initial_delay=(0 if cfg.CONF.banggoo.reconcile_on_startup
+                               else interval))
+        elif cfg.CONF.banggoo.reconcile_on_startup:
+            eventlet.spawn_n(self.reconciler.run)
+        if journal_entries:
+            LOG.info(_("Recovering %d interrupted Banggoo operations"),
+                     len(journal_entries))
+            eventlet.spawn_n(
+                bg_journal.JournalRecovery(self, self.journal).recover,
+                journal_entries)
+        # sent the seconds the warm-up took once it is over
+        self.warmed_up = event.Event()
+        if cfg.CONF.banggoo.warm_up:
+            eventlet.spawn_n(self._warm_up)
+        else:
+            self.warmed_up.send(0.0)
+
+    def _warm_up(self):
+        """Get connections and caches ready for the first API calls."""
+        started = time.time()
+        workers = eventlet.GreenPool()
+        for client in self.client.endpoints:
+            workers.spawn_n(self._warm_up_step, client.warm_up,
+                            cfg.CONF.banggoo.warm_up_connections)
+        if self.stats_refresher is not None:
+            workers.spawn_n(self._warm_up_step, self.stats_refresher.prime)
+        if self.lookup_cache is not None:
+            workers.spawn_n(self._warm_up_step, self._prefetch_lookups)
+        workers.waitall()
+        seconds = time.time() - started
+        LOG.info(_("Banggoo driver warm-up finished in %.2fs"), seconds)
+        self.warmed_up.send(seconds)
+
+    def _warm_up_step(self, func, *args):
+        try:
+            func(*args)
+        except Exception:
+            # a cold start is slower, not broken
+            LOG.exception(_("Banggoo driver warm-up step failed"))
+
+    def _prefetch_lookups(self):
+        """Cache the subnets and networks of existing pools and vips."""
+        context = n_context.get_admin_context()
+        core_plugin = self.plugin._core_plugin
+        subnet_ids = set(pool['subnet_id'] for pool in
+                         self.plugin.get_pools(context,
+                                               fields=['subnet_id']))
+        subnet_ids.update(vip['subnet_id'] for vip in
+                          self.plugin.get_vips(context,
+                                               fields=['subnet_id']))
+        # networks take a cache entry each as well
+        subnet_ids = list(subnet_ids)[:cfg.CONF.banggoo.lookup_cache_size // 2]
+        if not subnet_ids:
+            return
+        subnets = core_plugin.get_subnets(context,
+                                          filters={'id': subnet_ids})
+        networks = core_plugin.get_networks(
+            context, filters={'id': list(set(subnet['network_id']
+                                             for subnet in subnets))})
+        for subnet in subnets:
+            self.lookup_cache.set(('subnet', subnet['id']), subnet)
+        for network in networks:
+            self.lookup_cache.set(('network', network['id']), network)
+        LOG.info(_("Prefetched %(subnets)d subnets and %(networks)d "
+                   "networks"),
+                 {'subnets': len(subnets), 'networks': len(networks)})
+
+    def render_metrics(self):
+        """Return the request metrics in Prometheus text format."""
+        text = bg_metrics.render(dict((client.service_uri, client.metrics)
+                                      for client in self.client.endpoints))
+        schedulers = dict((client.service_uri, client.scheduler.stats())
+                          for client in self.client.endpoints
+                          if client.scheduler is not None)
+        if schedulers:
+            text += bg_metrics.render_scheduler(schedulers)
+        groups = [group for group in self.client.clients if group.standbys]
+        if groups:
+            text += bg_metrics.render_groups(
+                dict((group.service_uri, group.status())
+                     for group in groups))
+        if self.stats_history is not None:
+            text += bg_metrics.render_history(self.stats_history.summaries(
+                cfg.CONF.banggoo.stats_history_window))
+        return text
+
+    def _create_client(self, uri, username, password):
+        conf = cfg.CONF.banggoo
+        scheduler = None
+        if conf.max_in_flight > 0 or conf.tenant_rate_limit > 0:
+            scheduler = bg_sched.FairScheduler(
+                max_in_flight=conf.max_in_flight,
+                rate=conf.tenant_rate_limit,
+                burst=conf.tenant_burst,
+                weights=conf.tenant_weights)
+        return bg_client.BGClient(
+            uri, username, password,
+            pool_connections=conf.http_pool_connections,
+            pool_maxsize=conf.http_pool_maxsize,
+            pool_idle_timeout=conf.http_pool_idle_timeout,
+            connect_timeout=conf.http_connect_timeout,
+            read_timeouts=conf.http_read_timeouts,
+            breaker=bg_client.CircuitBreaker(conf.breaker_failure_threshold,
+                                             conf.breaker_reset_timeout),
+            max_retries=conf.http_max_retries,
+            retry_backoff=conf.http_retry_backoff,
+            scheduler=scheduler,
+            auth_mode=conf.adc_auth_mode,
+            token_refresh_margin=conf.adc_token_refresh_margin,
+            token_lifetime=conf.adc_token_lifetime,
+            journal=self.journal,
+            compression=conf.endpoint_compression.get(
+                urlparse.urlparse(uri).hostname, conf.request_compression),
+            compression_threshold=conf.compression_threshold,
+            accept_compressed=conf.accept_compressed_responses)
+
+    def _resync_device(self, group, client):
+        """Bring a lagging standby of a device group in line with neutron.
+
+        Returns whether every difference could be applied. The objects
+        keep the status they got from the active device.
+        """
+        def owns(tenant_id):
+            return self.client.client_for(tenant_id) is group
+        report = self.reconciler.reconcile(client, owns=owns,
+                                           update_status=False)
+        return not report['failures']
+
+    def _dispatch(self, context, model, key, func, *args, **kwargs):
+        """Run a device operation now or queue it for the async workers.
+
+        In async mode the API call returns with the object still in
+        PENDING_* and a worker later writes ACTIVE or ERROR. Operations
+        sharing ``key`` run in submission order; ``parent`` makes an
+        operation wait for queued work of its parent object.
+        """
+        parent = kwargs.pop('parent', None)
+        if self.workers is None:
+            return func(context, *args)
+        # the request's DB session must not be used from another thread
+        context = n_context.Context.from_dict(context.to_dict())
+        self.workers.submit(key, self._run_async, context, model, key,
+                            func, context, *args, parent=parent)
+
+    def _update(self, context, model, key, func, old_obj, obj, *args):
+        """Run an update through _dispatch, merged with queued ones.
+
+        With coalescing enabled an update of an object that already has
+        one waiting is folded into it, see bg_coalesce.UpdateCoalescer.
+        """
+        if self.coalescer is None:
+            return self._dispatch(context, model, key, func, old_obj, obj,
+                                  *args)
+        if self.workers is None:
+            return self.coalescer.push(key, func, context, old_obj, obj,
+                                       *args)
+        context = n_context.Context.from_dict(context.to_dict())
+        if self.coalescer.queue(key, func, context, old_obj, obj, *args):
+            self.workers.submit(key, self._run_async, context, model, key,
+                                self.coalescer.run, key)
+
+    def _run_async(self, context, model, key, func, *args):
+        """Run a queued operation, leaving its object in ERROR on failure.
+
+        Device errors are turned into ERROR by the operation itself; any
+        other exception, e.g. from the core plugin or the DB, would leave
+        the object in PENDING_* for good.
+        """
+        try:
+            func(*args)
+        except Exception:
+            LOG.exception(_("Banggoo background operation on %s failed"),
+                          key)
+            try:
+                with bg_trace.span('update_status'):
+                    self._set_error(context, model, key)
+            except Exception:
+                LOG.exception(_("Could not set %s to ERROR"), key)
+
+    def _set_error(self, context, model, key):
+        if model is loadbalancer_db.PoolMonitorAssociation:
+            health_monitor_id, pool_id = key
+            self.plugin.update_pool_health_monitor(context,
+                                                   health_monitor_id,
+                                                   pool_id,
+                                                   constants.ERROR, "")
+        else:
+            self.plugin.update_status(context, model, key, constants.ERROR)
 
     def create_vip(self, context, vip):
         """Create a vip on a Banggoo device."""
-        network_info = self._get_vip_network_info(context, vip)
-        bg_vip = self._prepare_vip_for_creation(vip)
-        bg_vip = dict(bg_vip.items() + network_info.items())
+        self._dispatch(context, loadbalancer_db.Vip, vip['id'],
+                       self._create_vip, vip, parent=vip['pool_id'])
+
+    @bg_trace.traced('create_vip')
+    @bg_journal.journaled
+    def _create_vip(self, context, vip):
+        bg_vip = self._build_vip(context, vip)
         msg = _("Banggoo driver vip creation: %s") % repr(bg_vip)
         LOG.debug(msg)
         status = constants.ACTIVE
@@ -71,31 +582,49 @@ class BanggooLoadBalancerDriver(abstract_driver.LoadBalancerAbstractDriver):
                                         VIP_RESOURCE, bg_vip)
         except bg_client.BGException:
             status = constants.ERROR
-            self.plugin._delete_db_vip(context, vip['id'])
-            raise PoolParaError
+            if self.workers is None:
+                self.plugin._delete_db_vip(context, vip['id'])
+                raise PoolParaError
 
-        self.plugin.update_status(context, loadbalancer_db.Vip, vip["id"],
-                                  status)
+        with bg_trace.span('update_status'):
+            self.plugin.update_status(context, loadbalancer_db.Vip, vip["id"],
+                                      status)
 
     def update_vip(self, context, old_vip, vip):
         """Update a vip on a Banggoo device."""
-        update_vip = self._prepare_vip_for_update(vip)
+        self._update(context, loadbalancer_db.Vip, vip['id'],
+                     self._update_vip, old_vip, vip)
+
+    @bg_trace.traced('update_vip')
+    @bg_journal.journaled
+    def _update_vip(self, context, old_vip, vip):
+        update_vip = self._prepare_delta(self._prepare_vip_for_update,
+                                         old_vip, vip)
         resource_path = "%s/%s" % (VIPS_RESOURCE, vip["id"])
         msg = (_("Banggoo driver vip %(vip_id)s update: %(vip_obj)s") %
-               {"vip_id": vip["id"], "vip_obj": repr(vip)})
+               {"vip_id": vip["id"], "vip_obj": repr(update_vip)})
         LOG.debug(msg)
         status = constants.ACTIVE
-        try:
-            self.client.update_resource(context.tenant_id, resource_path,
-                                        VIP_RESOURCE, update_vip)
-        except bg_client.BGException:
-            status = constants.ERROR
+        if update_vip:
+            try:
+                self.client.update_resource(context.tenant_id, resource_path,
+                                            VIP_RESOURCE, update_vip)
+            except bg_client.BGException:
+                status = constants.ERROR
+        with bg_trace.span('update_status'):
+            self.plugin.update_status(context, loadbalancer_db.Vip,
+                                      old_vip["id"], status)
+        if status == constants.ERROR and self.workers is None:
             raise PoolParaError
-        self.plugin.update_status(context, loadbalancer_db.Vip, old_vip["id"],
-                                  status)
 
     def delete_vip(self, context, vip):
         """Delete a vip on a Banggoo device."""
+        self._dispatch(context, loadbalancer_db.Vip, vip['id'],
+                       self._delete_vip, vip)
+
+    @bg_trace.traced('delete_vip')
+    @bg_journal.journaled
+    def _delete_vip(self, context, vip):
         resource_path = "%s/%s" % (VIPS_RESOURCE, vip["id"])
         msg = _("Banggoo driver vip removal: %s") % vip["id"]
         LOG.debug(msg)
@@ -103,21 +632,22 @@ class BanggooLoadBalancerDriver(abstract_driver.LoadBalancerAbstractDriver):
             self.client.remove_resource(context.tenant_id, resource_path)
             self.plugin._delete_db_vip(context, vip['id'])
         except bg_client.BGException:
-            self.plugin.update_status(context, loadbalancer_db.Vip,
-                                      vip["id"],
-                                      constants.ERROR)
-            raise PoolParaError
+            with bg_trace.span('update_status'):
+                self.plugin.update_status(context, loadbalancer_db.Vip,
+                                          vip["id"],
+                                          constants.ERROR)
+            if self.workers is None:
+                raise PoolParaError
 
     def create_pool(self, context, pool):
         """Create a pool on a Banggoo device."""
-        network_info = self._get_pool_network_info(context, pool)
-        #allocate a snat port/ipaddress on the subnet if one doesn't exist
-        self._create_snatport_for_subnet_if_not_exists(context,
-                                                       pool['tenant_id'],
-                                                       pool['subnet_id'],
-                                                       network_info)
-        bg_pool = self._prepare_pool_for_creation(pool)
-        bg_pool = dict(bg_pool.items() + network_info.items())
+        self._dispatch(context, loadbalancer_db.Pool, pool['id'],
+                       self._create_pool, pool)
+
+    @bg_trace.traced('create_pool')
+    @bg_journal.journaled
+    def _create_pool(self, context, pool):
+        bg_pool = self._build_pool(context, pool)
         msg = _("Banggoo driver pool creation: %s") % repr(bg_pool)
         LOG.debug(msg)
         status = constants.ACTIVE
@@ -130,70 +660,137 @@ class BanggooLoadBalancerDriver(abstract_driver.LoadBalancerAbstractDriver):
 
         except bg_client.BGException:
             status = constants.ERROR
-            self.plugin._delete_db_pool(context, bg_pool['id'])
-            raise PoolParaError
+            if self.workers is None:
+                self.plugin._delete_db_pool(context, bg_pool['id'])
+                raise PoolParaError
+        else:
+            self.snat_index.acquire(pool['tenant_id'], pool['subnet_id'],
+                                    pool['id'])
 
-        self.plugin.update_status(context, loadbalancer_db.Pool,
-                                  bg_pool["id"], status)
+        with bg_trace.span('update_status'):
+            self.plugin.update_status(context, loadbalancer_db.Pool,
+                                      bg_pool["id"], status)
 
     def update_pool(self, context, old_pool, pool):
         """Update a pool on a Banggoo device."""
-        bg_pool = self._prepare_pool_for_update(pool)
+        self._update(context, loadbalancer_db.Pool, pool['id'],
+                     self._update_pool, old_pool, pool)
+
+    @bg_trace.traced('update_pool')
+    @bg_journal.journaled
+    def _update_pool(self, context, old_pool, pool):
+        bg_pool = self._prepare_delta(self._prepare_pool_for_update,
+                                      old_pool, pool)
         resource_path = "%s/%s" % (POOLS_RESOURCE, old_pool["id"])
         msg = (_("Banggoo driver pool %(pool_id)s update: %(pool_obj)s") %
                {"pool_id": old_pool["id"], "pool_obj": repr(bg_pool)})
         LOG.debug(msg)
         status = constants.ACTIVE
-        try:
-            self.client.update_resource(context.tenant_id, resource_path,
-                                        POOL_RESOURCE, bg_pool)
-        except bg_client.BGException:
-            status = constants.ERROR
+        if bg_pool:
+            try:
+                self.client.update_resource(context.tenant_id, resource_path,
+                                            POOL_RESOURCE, bg_pool)
+            except bg_client.BGException:
+                status = constants.ERROR
+        with bg_trace.span('update_status'):
+            self.plugin.update_status(context, loadbalancer_db.Pool,
+                                      old_pool["id"], status)
+        if status == constants.ERROR and self.workers is None:
             raise PoolParaError
-        self.plugin.update_status(context, loadbalancer_db.Pool,
-                                  old_pool["id"], status)
 
     def delete_pool(self, context, pool):
         """Delete a pool on a Banggoo device."""
+        self._dispatch(context, loadbalancer_db.Pool, pool['id'],
+                       self._delete_pool, pool)
+
+    @bg_trace.traced('delete_pool')
+    @bg_journal.journaled
+    def _delete_pool(self, context, pool):
         resource_path = "%s/%s" % (POOLS_RESOURCE, pool['id'])
+        if self.cascade_pool_delete:
+            resource_path += '?cascade=true'
         msg = _("Banggoo driver pool removal: %s") % pool["id"]
         LOG.debug(msg)
         status = constants.ACTIVE
         try:
             self.client.remove_resource(context.tenant_id, resource_path)
 
-            self.plugin._delete_db_pool(context, pool['id'])
-            self._remove_snatport_for_subnet_if_not_used(context,pool['tenant_id'],pool['subnet_id'])
+            if self.cascade_pool_delete:
+                self._delete_db_pool_cascade(context, pool['id'])
+            else:
+                self.plugin._delete_db_pool(context, pool['id'])
+            self._remove_snatport_for_subnet_if_not_used(context,pool['tenant_id'],pool['subnet_id'],pool['id'])
+            if self.stats_cache is not None:
+                self.stats_cache.pop(pool['id'])
+            if self.stats_history is not None:
+                self.stats_history.forget(pool['id'])
         except bg_client.BGException:
             status = constants.ERROR
-            self.plugin.update_status(context, loadbalancer_db.Pool,pool["id"],status)
-            raise PoolParaError
+            with bg_trace.span('update_status'):
+                self.plugin.update_status(context, loadbalancer_db.Pool,pool["id"],status)
+            if self.workers is None:
+                raise PoolParaError
 
         #self.plugin.update_status(context, loadbalancer_db.Pool,pool["id"],status)
 
 
+    def _delete_db_pool_cascade(self, context, pool_id):
+        """Delete a pool with its members and monitor associations.
+
+        Members and associations go with one DELETE statement each instead
+        of being loaded and deleted row by row by the ORM cascade.
+        """
+        with context.session.begin(subtransactions=True):
+            context.session.query(loadbalancer_db.Member).filter_by(
+                pool_id=pool_id).delete(synchronize_session=False)
+            context.session.query(
+                loadbalancer_db.PoolMonitorAssociation).filter_by(
+                    pool_id=pool_id).delete(synchronize_session=False)
+            self.plugin._delete_db_pool(context, pool_id)
+
+    def _pool_deleting(self, context, pool_id):
+        try:
+            pool = self.plugin.get_pool(context, pool_id, fields=['status'])
+        except loadbalancer.PoolNotFound:
+            return True
+        return pool['status'] == constants.PENDING_DELETE
+
     def create_member(self, context, member):
         """Create a pool member on a Banggoo device."""
+        self._dispatch(context, loadbalancer_db.Member, member['id'],
+                       self._create_member, member,
+                       parent=member['pool_id'])
+
+    @bg_trace.traced('create_member')
+    @bg_journal.journaled
+    def _create_member(self, context, member):
         bg_member = self._prepare_member_for_creation(member)
         msg = (_("Banggoo driver poolmember creation: %s") %
                repr(bg_member))
         LOG.info(msg)
         status = constants.ACTIVE
         try:
-            self.client.create_resource(context.tenant_id,
-                                        POOLMEMBERS_RESOURCE,
-                                        POOLMEMBER_RESOURCE,
-                                        bg_member)
+            self._push_member(context.tenant_id, 'create', member['id'],
+                              bg_member)
         except bg_client.BGException:
             status = constants.ERROR
-            self.plugin._delete_db_member(context, member['id'])
-            raise PoolParaError
-        self.plugin.update_status(context, loadbalancer_db.Member,
-                                  member["id"], status)
+            if self.workers is None:
+                self.plugin._delete_db_member(context, member['id'])
+                raise PoolParaError
+        with bg_trace.span('update_status'):
+            self.plugin.update_status(context, loadbalancer_db.Member,
+                                      member["id"], status)
 
     def update_member(self, context, old_member, member):
         """Update a pool member on a Banggoo device."""
-        bg_member = self._prepare_member_for_update(member)
+        self._update(context, loadbalancer_db.Member, member['id'],
+                     self._update_member, old_member, member)
+
+    @bg_trace.traced('update_member')
+    @bg_journal.journaled
+    def _update_member(self, context, old_member, member):
+        bg_member = self._prepare_delta(self._prepare_member_for_update,
+                                        old_member, member)
         resource_path = "%s/%s" % (POOLMEMBERS_RESOURCE, old_member["id"])
         msg = (_("Banggoo driver poolmember %(member_id)s update:"
                  " %(member_obj)s") %
@@ -201,35 +798,92 @@ class BanggooLoadBalancerDriver(abstract_driver.LoadBalancerAbstractDriver):
                 "member_obj": repr(bg_member)})
         LOG.debug(msg)
         status = constants.ACTIVE
-        try:
-            self.client.update_resource(context.tenant_id, resource_path,
-                                        POOLMEMBER_RESOURCE, bg_member)
-        except bg_client.BGException:
-            status = constants.ERROR
+        if bg_member:
+            try:
+                self.client.update_resource(context.tenant_id, resource_path,
+                                            POOLMEMBER_RESOURCE, bg_member)
+            except bg_client.BGException:
+                status = constants.ERROR
+        with bg_trace.span('update_status'):
+            self.plugin.update_status(context, loadbalancer_db.Member,
+                                      old_member["id"], status)
+        if status == constants.ERROR and self.workers is None:
             raise PoolParaError
-        self.plugin.update_status(context, loadbalancer_db.Member,
-                                  old_member["id"], status)
 
     def delete_member(self, context, member):
         """Delete a pool member on a Banggoo device."""
-        resource_path = "%s/%s" % (POOLMEMBERS_RESOURCE, member['id'])
+        self._dispatch(context, loadbalancer_db.Member, member['id'],
+                       self._delete_member, member)
+
+    @bg_trace.traced('delete_member')
+    @bg_journal.journaled
+    def _delete_member(self, context, member):
         msg = (_("Banggoo driver poolmember removal: %s") %
                member["id"])
         LOG.debug(msg)
         try:
-            self.client.remove_resource(context.tenant_id, resource_path)
+            self._push_member(context.tenant_id, 'delete', member['id'])
             self.plugin._delete_db_member(context, member['id'])
         except bg_client.BGException:
-            self.plugin.update_status(context, loadbalancer_db.Member,
-                                      member["id"],
-                                      constants.ERROR)
-            raise PoolParaError
+            with bg_trace.span('update_status'):
+                self.plugin.update_status(context, loadbalancer_db.Member,
+                                          member["id"],
+                                          constants.ERROR)
+            if self.workers is None:
+                raise PoolParaError
+
+    def _push_member(self, tenant_id, op, member_id, bg_member=None):
+        """Create or remove a member, batched with concurrent ones."""
+        if self.member_batcher is None:
+            self._push_member_now(tenant_id, op, member_id, bg_member)
+        else:
+            self.member_batcher.submit((tenant_id, op), member_id, bg_member)
+
+    def _push_member_now(self, tenant_id, op, member_id, bg_member):
+        if op == 'create':
+            self.client.create_resource(tenant_id, POOLMEMBERS_RESOURCE,
+                                        POOLMEMBER_RESOURCE, bg_member)
+        else:
+            resource_path = "%s/%s" % (POOLMEMBERS_RESOURCE, member_id)
+            self.client.remove_resource(tenant_id, resource_path)
+
+    def _flush_members(self, batch_key, members):
+        tenant_id, op = batch_key
+        if len(members) == 1:
+            member_id, bg_member = members[0]
+            try:
+                self._push_member_now(tenant_id, op, member_id, bg_member)
+            except bg_client.BGException as e:
+                return {member_id: e}
+            return {}
+        member_ids = [queued_id for queued_id, _queued in members]
+        msg = (_("Banggoo driver bulk poolmember %(op)s: %(count)d members") %
+               {"op": op, "count": len(members)})
+        LOG.debug(msg)
+        if op == 'create':
+            resp = self.client.bulk_create_resources(
+                tenant_id, POOLMEMBERS_RESOURCE, POOLMEMBERS_RESOURCE,
+                [queued for _queued_id, queued in members])
+        else:
+            resp = self.client.bulk_remove_resources(
+                tenant_id, POOLMEMBERS_RESOURCE, member_ids)
+        failed = self.client.failed_bulk_items(resp[1], member_ids)
+        error = bg_client.BGException(bg_client.BGException.RESPONSE_ERROR)
+        return dict((failed_id, error) for failed_id in failed)
 
     #def create_health_monitor(self, context, health_monitor):
     #    """Create a pool health monitor on a Banggoo device."""
 
     def create_pool_health_monitor(self, context, health_monitor, pool_id):
         """Create a pool health monitor on a Banggoo device."""
+        self._dispatch(context, loadbalancer_db.PoolMonitorAssociation,
+                       (health_monitor['id'], pool_id),
+                       self._create_pool_health_monitor,
+                       health_monitor, pool_id, parent=pool_id)
+
+    @bg_trace.traced('create_pool_health_monitor')
+    @bg_journal.journaled
+    def _create_pool_health_monitor(self, context, health_monitor, pool_id):
         bg_hm = self._prepare_healthmonitor_for_creation(health_monitor,
                                                           pool_id)
         resource_path = "%s/%s/%s" % (POOLS_RESOURCE, pool_id,
@@ -246,19 +900,34 @@ class BanggooLoadBalancerDriver(abstract_driver.LoadBalancerAbstractDriver):
                                         bg_hm)
         except bg_client.BGException:
             status = constants.ERROR
-            self.plugin._delete_db_pool_health_monitor(context,
-                                                       health_monitor['id'],
-                                                       pool_id)
-            raise PoolParaError
-        self.plugin.update_pool_health_monitor(context,
-                                               health_monitor['id'],
-                                               pool_id,
-                                               status, "")
+            if self.workers is None:
+                self.plugin._delete_db_pool_health_monitor(
+                    context, health_monitor['id'], pool_id)
+                raise PoolParaError
+        with bg_trace.span('update_status'):
+            self.plugin.update_pool_health_monitor(context,
+                                                   health_monitor['id'],
+                                                   pool_id,
+                                                   status, "")
 
     def update_pool_health_monitor(self, context, old_health_monitor,
                                    health_monitor, pool_id):
         """Update a pool health monitor on a Banggoo device."""
-        bg_hm = self._prepare_healthmonitor_for_update(health_monitor)
+        self._update(context, loadbalancer_db.PoolMonitorAssociation,
+                     (health_monitor['id'], pool_id),
+                     self._update_pool_health_monitor,
+                     old_health_monitor, health_monitor, pool_id)
+
+    @bg_trace.traced('update_pool_health_monitor')
+    @bg_journal.journaled
+    def _update_pool_health_monitor(self, context, old_health_monitor,
+                                    health_monitor, pool_id):
+        # a monitor has a status per pool it is associated with
+        old_status = dict((assoc['pool_id'], assoc['status'])
+                          for assoc in old_health_monitor.get('pools', []))
+        bg_hm = self._prepare_delta(self._prepare_healthmonitor_for_update,
+                                    old_health_monitor, health_monitor,
+                                    old_status.get(pool_id))
         resource_path = "%s/%s" % (MONITORS_RESOURCE,
                                    old_health_monitor["id"])
         msg = (_("Banggoo driver healthmonitor %(monitor_id)s update: "
@@ -267,19 +936,30 @@ class BanggooLoadBalancerDriver(abstract_driver.LoadBalancerAbstractDriver):
                 "monitor_obj": repr(bg_hm)})
         LOG.debug(msg)
         status = constants.ACTIVE
-        try:
-            self.client.update_resource(context.tenant_id, resource_path,
-                                        MONITOR_RESOURCE, bg_hm)
-        except bg_client.BGException:
-            status = constants.ERROR
+        if bg_hm:
+            try:
+                self.client.update_resource(context.tenant_id, resource_path,
+                                            MONITOR_RESOURCE, bg_hm)
+            except bg_client.BGException:
+                status = constants.ERROR
+        with bg_trace.span('update_status'):
+            self.plugin.update_pool_health_monitor(context,
+                                                   old_health_monitor['id'],
+                                                   pool_id,
+                                                   status, "")
+        if status == constants.ERROR and self.workers is None:
             raise PoolParaError
-        self.plugin.update_pool_health_monitor(context,
-                                               old_health_monitor['id'],
-                                               pool_id,
-                                               status, "")
 
     def delete_pool_health_monitor(self, context, health_monitor, pool_id):
         """Delete a pool health monitor on a Banggoo device."""
+        self._dispatch(context, loadbalancer_db.PoolMonitorAssociation,
+                       (health_monitor['id'], pool_id),
+                       self._delete_pool_health_monitor,
+                       health_monitor, pool_id)
+
+    @bg_trace.traced('delete_pool_health_monitor')
+    @bg_journal.journaled
+    def _delete_pool_health_monitor(self, context, health_monitor, pool_id):
         resource_path = "%s/%s/%s/%s" % (POOLS_RESOURCE, pool_id,
                                          MONITORS_RESOURCE,
                                          health_monitor["id"])
@@ -288,18 +968,35 @@ class BanggooLoadBalancerDriver(abstract_driver.LoadBalancerAbstractDriver):
                {"monitor_id": health_monitor["id"],
                 "pool_id": pool_id})
         LOG.debug(msg)
+        if self.cascade_pool_delete and self._pool_deleting(context, pool_id):
+            # the cascading pool removal takes the monitor off the device
+            try:
+                self.plugin._delete_db_pool_health_monitor(
+                    context, health_monitor['id'], pool_id)
+            except (loadbalancer.PoolNotFound,
+                    loadbalancer.PoolMonitorAssociationNotFound):
+                pass
+            return
         try:
             self.client.remove_resource(context.tenant_id, resource_path)
             self.plugin._delete_db_pool_health_monitor(context,health_monitor['id'],pool_id)
         except bg_client.BGException:
-            self.plugin.update_pool_health_monitor(context,
-                                                   health_monitor['id'],
-                                                   pool_id,
-                                                   constants.ERROR, "")
-            raise PoolParaError
+            with bg_trace.span('update_status'):
+                self.plugin.update_pool_health_monitor(context,
+                                                       health_monitor['id'],
+                                                       pool_id,
+                                                       constants.ERROR, "")
+            if self.workers is None:
+                raise PoolParaError
 
+    @bg_trace.traced('stats')
     def stats(self, context, pool_id):
         """Retrieve pool statistics from the Banggoo device."""
+        if self.stats_cache is not None:
+            stats = self.stats_cache.get(pool_id)
+            if stats is not None:
+                return stats
+            self.stats_refresher.watch(context.tenant_id)
         resource_path = "%s/%s" % (POOLSTATS_RESOURCE, pool_id)
         msg = _("Banggoo driver pool stats retrieval: %s") % pool_id
         LOG.debug(msg)
@@ -307,11 +1004,86 @@ class BanggooLoadBalancerDriver(abstract_driver.LoadBalancerAbstractDriver):
             stats = self.client.retrieve_resource(context.tenant_id,
                                                   resource_path)[1]
         except bg_client.BGException:
-            self.plugin.update_status(context, loadbalancer_db.Pool,
-                                      pool_id, constants.ERROR)
+            with bg_trace.span('update_status'):
+                self.plugin.update_status(context, loadbalancer_db.Pool,
+                                          pool_id, constants.ERROR)
         else:
+            stats = stats.get('dict')
+            if self.stats_cache is not None and stats is not None:
+                self.stats_cache.set(pool_id, stats)
+            if self.stats_history is not None and stats is not None:
+                self.stats_history.record(pool_id, stats)
             return stats
 
+    def stats_history_summary(self, pool_id, window=None):
+        """Return rates and aggregates of recent pool statistics.
+
+        Served from memory without asking the device: per second rates of
+        bytes_in, bytes_out and total_connections, and peak and average
+        active_connections over the last window seconds, or None when the
+        history is disabled or holds no sample of the pool.
+        """
+        if self.stats_history is None:
+            return None
+        if window is None:
+            window = cfg.CONF.banggoo.stats_history_window
+        return self.stats_history.summary(pool_id, window)
+
+    def _fetch_bulk_stats(self, tenant_id):
+        """Fetch statistics of all pools of a tenant in one request.
+
+        Without a tenant every Control Center is asked once for all of its
+        pools. The device lists them either as a dict keyed by pool id or
+        as a list of statistics carrying a pool_id.
+        """
+        msg = (_("Banggoo driver bulk pool stats retrieval for tenant %s") %
+               (tenant_id or 'all'))
+        LOG.debug(msg)
+        if tenant_id is not None:
+            return self._parse_bulk_stats(self.client.retrieve_collection(
+                tenant_id, POOLSTATS_RESOURCE, POOLSTATS_RESOURCE))
+        pool_stats = {}
+        for client in self.client.clients:
+            pool_stats.update(self._parse_bulk_stats(
+                client.retrieve_collection(None, POOLSTATS_RESOURCE,
+                                           POOLSTATS_RESOURCE)))
+        return pool_stats
+
+    def _parse_bulk_stats(self, items):
+        # keyed by pool id in a dict, carrying a pool_id in a list
+        return dict((pool_id or item['pool_id'], item)
+                    for pool_id, item in items)
+
+    def _fetch_member_status(self):
+        """Fetch the health of every member, one request per device.
+
+        The device lists it either as a dict keyed by member id or as a
+        list of {"id": ..., "status": ...}.
+        """
+        member_status = {}
+        for client in self.client.clients:
+            for member_id, item in client.retrieve_collection(
+                    None, MEMBER_STATUS_RESOURCE, POOLMEMBERS_RESOURCE):
+                if member_id is None:
+                    member_id, item = item['id'], item['status']
+                member_status[member_id] = item
+        return member_status
+
+    def _build_vip(self, context, vip):
+        network_info = self._get_vip_network_info(context, vip)
+        bg_vip = self._prepare_vip_for_creation(vip)
+        return dict(bg_vip.items() + network_info.items())
+
+    def _build_pool(self, context, pool):
+        network_info = self._get_pool_network_info(context, pool)
+        #allocate a snat port/ipaddress on the subnet if one doesn't exist
+        self._create_snatport_for_subnet_if_not_exists(context,
+                                                       pool['tenant_id'],
+                                                       pool['subnet_id'],
+                                                       network_info)
+        bg_pool = self._prepare_pool_for_creation(pool)
+        return dict(bg_pool.items() + network_info.items())
+
     def _prepare_vip_for_creation(self, vip):
         creation_attrs = {
             'id': vip['id'],
@@ -336,6 +1108,24 @@ class BanggooLoadBalancerDriver(abstract_driver.LoadBalancerAbstractDriver):
             'session_persistence':vip['session_persistence']
         }
 
+    def _prepare_delta(self, prepare, old_obj, obj, old_status=None):
+        """Return the device fields of obj that differ from old_obj.
+
+        An empty dict means the device needs no update. Only an object
+        that was ACTIVE or INACTIVE is known to match old_obj on the
+        device; any other, e.g. left in ERROR or PENDING_UPDATE by a
+        failed push, gets the full body. ``old_status`` defaults to the
+        status of old_obj.
+        """
+        body = prepare(obj)
+        if old_status is None:
+            old_status = old_obj.get('status')
+        if old_status not in (constants.ACTIVE, constants.INACTIVE):
+            return body
+        old_body = prepare(old_obj)
+        return dict((key, value) for key, value in body.items()
+                    if key not in old_body or old_body[key] != value)
+
     def _prepare_pool_for_creation(self, pool):
         creation_attrs = {
             'id': pool['id'],
@@ -397,12 +1187,51 @@ class BanggooLoadBalancerDriver(abstract_driver.LoadBalancerAbstractDriver):
             bg_hm['expected_codes'] = health_monitor['expected_codes']
         return bg_hm
 
+    def invalidate_subnet(self, subnet_id):
+        """Forget the cached lookup of a deleted or changed subnet."""
+        if self.lookup_cache is not None:
+            self.lookup_cache.pop(('subnet', subnet_id))
+
+    def invalidate_network(self, network_id):
+        """Forget the cached lookup of a deleted or changed network."""
+        if self.lookup_cache is not None:
+            self.lookup_cache.pop(('network', network_id))
+
+    def _get_subnet(self, context, subnet_id):
+        return self._lookup(context, 'subnet', subnet_id,
+                            self.plugin._core_plugin.get_subnet)
+
+    def _get_network(self, context, network_id):
+        return self._lookup(context, 'network', network_id,
+                            self.plugin._core_plugin.get_network)
+
+    def _lookup(self, context, kind, obj_id, fetch):
+        # a request sees one answer per object even with the process wide
+        # cache disabled, which keeps create_pool at a single get_subnet
+        scoped = getattr(context, '_banggoo_lookups', None)
+        if scoped is None:
+            scoped = {}
+            setattr(context, '_banggoo_lookups', scoped)
+        key = (kind, obj_id)
+        if key in scoped:
+            return scoped[key]
+        obj = None
+        if self.lookup_cache is not None:
+            obj = self.lookup_cache.get(key)
+        if obj is None:
+            obj = fetch(context, obj_id)
+            if self.lookup_cache is not None:
+                self.lookup_cache.set(key, obj)
+        scoped[key] = obj
+        return obj
+
+    @bg_trace.spanned('network_info')
     def _get_network_info(self, context, entity):
         network_info = {}
         subnet_id = entity['subnet_id']
-        subnet = self.plugin._core_plugin.get_subnet(context, subnet_id)
+        subnet = self._get_subnet(context, subnet_id)
         network_id = subnet['network_id']
-        network = self.plugin._core_plugin.get_network(context, network_id)
+        network = self._get_network(context, network_id)
         network_info['network_id'] = network_id
         network_info['subnet_id'] = subnet_id
         if PROV_NET_TYPE in network:
@@ -423,9 +1252,32 @@ class BanggooLoadBalancerDriver(abstract_driver.LoadBalancerAbstractDriver):
         filter_dict = {'subnet_id': [subnet_id], 'tenant_id': [tenant_id]}
         return self.plugin.get_pools(context, filters=filter_dict)
 
+    def _load_snat_index(self):
+        """Build the SNAT port index from neutron in one pass."""
+        context = n_context.get_admin_context()
+        try:
+            ports = self.plugin._core_plugin.get_ports(
+                context, filters={'device_owner': [DRIVER_NAME]})
+            pools = self.plugin.get_pools(
+                context, fields=['id', 'tenant_id', 'subnet_id'])
+        except Exception:
+            LOG.exception(_("Unable to load the SNAT port index, falling "
+                            "back to per-pool lookups"))
+            return
+        self.snat_index.load(
+            ((port['tenant_id'], port['fixed_ips'][0]['subnet_id'], port)
+             for port in ports
+             if port['device_id'].startswith(SNATPORT_PREFIX) and
+             port['fixed_ips']),
+            ((pool['tenant_id'], pool['subnet_id'], pool['id'])
+             for pool in pools))
+        msg = (_("Loaded %(ports)d SNAT ports used by %(pools)d pools") %
+               {'ports': len(ports), 'pools': len(pools)})
+        LOG.info(msg)
+
     def _get_snatport_for_subnet(self, context, tenant_id, subnet_id):
-        device_id = '_lb-snatport-' + subnet_id
-        subnet = self.plugin._core_plugin.get_subnet(context, subnet_id)
+        device_id = SNATPORT_PREFIX + subnet_id
+        subnet = self._get_subnet(context, subnet_id)
         network_id = subnet['network_id']
         msg = (_("Filtering ports based on network_id=%(network_id)s, "
                  "tenant_id=%(tenant_id)s, device_id=%(device_id)s") %
@@ -450,36 +1302,60 @@ class BanggooLoadBalancerDriver(abstract_driver.LoadBalancerAbstractDriver):
 
     def _create_snatport_for_subnet(self, context, tenant_id, subnet_id,
                                     ip_address):
-        subnet = self.plugin._core_plugin.get_subnet(context, subnet_id)
+        subnet = self._get_subnet(context, subnet_id)
         fixed_ip = {'subnet_id': subnet['id']}
         if ip_address and ip_address != attributes.ATTR_NOT_SPECIFIED:
             fixed_ip['ip_address'] = ip_address
         port_data = {
             'tenant_id': tenant_id,
-            'name': '_lb-snatport-' + subnet_id,
+            'name': SNATPORT_PREFIX + subnet_id,
             'network_id': subnet['network_id'],
             'mac_address': attributes.ATTR_NOT_SPECIFIED,
             'admin_state_up': False,
-            'device_id': '_lb-snatport-' + subnet_id,
+            'device_id': SNATPORT_PREFIX + subnet_id,
             'device_owner': DRIVER_NAME,
             'fixed_ips': [fixed_ip],
         }
-        port = self.plugin._core_plugin.create_port(context,
-                                                    {'port': port_data})
+        try:
+            port = self.plugin._core_plugin.create_port(context,
+                                                        {'port': port_data})
+        except (qexception.SubnetNotFound, qexception.NetworkNotFound):
+            # the cached lookup outlived the subnet or its network
+            self.invalidate_subnet(subnet_id)
+            self.invalidate_network(subnet['network_id'])
+            raise
         msg = _("Created SNAT port: %s") % repr(port)
         LOG.info(msg)
         return port
 
     def _remove_snatport_for_subnet(self, context, tenant_id, subnet_id):
-        port = self._get_snatport_for_subnet(context, tenant_id, subnet_id)
+        port = self.snat_index.pop_port(tenant_id, subnet_id)
+        if not port:
+            port = self._get_snatport_for_subnet(context, tenant_id,
+                                                 subnet_id)
         if port:
             self.plugin._core_plugin.delete_port(context, port['id'])
             msg = _("Removed SNAT port: %s") % repr(port)
             LOG.info(msg)
 
+    @bg_trace.spanned('snat')
     def _create_snatport_for_subnet_if_not_exists(self, context, tenant_id,
                                                   subnet_id, network_info):
-        port = self._get_snatport_for_subnet(context, tenant_id, subnet_id)
+        # pools created on the same subnet at once share one lookup and
+        # one port
+        port = self.snat_flights.do((tenant_id, subnet_id),
+                                    self._ensure_snatport_for_subnet,
+                                    context, tenant_id, subnet_id)
+        network_info['port_id'] = port['id']
+        network_info['snat_ip'] = port['fixed_ips'][0]['ip_address']
+        msg = _("SNAT port: %s") % repr(port)
+        LOG.info(msg)
+
+    def _ensure_snatport_for_subnet(self, context, tenant_id, subnet_id):
+        port = self.snat_index.get(tenant_id, subnet_id)
+        if not port:
+            port = self._get_snatport_for_subnet(context, tenant_id,
+                                                 subnet_id)
         if not port:
             msg = _("No SNAT port found for subnet %s."
                     " Creating one...") % subnet_id
@@ -487,18 +1363,32 @@ class BanggooLoadBalancerDriver(abstract_driver.LoadBalancerAbstractDriver):
             port = self._create_snatport_for_subnet(context, tenant_id,
                                                     subnet_id,
                                                     ip_address=None)
-        network_info['port_id'] = port['id']
-        network_info['snat_ip'] = port['fixed_ips'][0]['ip_address']
-        msg = _("SNAT port: %s") % repr(port)
-        LOG.info(msg)
+        self.snat_index.add_port(tenant_id, subnet_id, port)
+        return port
 
+    @bg_trace.spanned('snat')
     def _remove_snatport_for_subnet_if_not_used(self, context, tenant_id,
-                                                subnet_id):
+                                                subnet_id, pool_id):
+        if self.snat_index.release(tenant_id, subnet_id, pool_id):
+            # other pools still use the port, no need to ask neutron
+            return
+        # never overlaps a creation on the subnet, so a pool being created
+        # is either seen below or finds the port gone and makes a new one
+        self.snat_flights.exclusive((tenant_id, subnet_id),
+                                    self._remove_unused_snatport_for_subnet,
+                                    context, tenant_id, subnet_id)
+
+    def _remove_unused_snatport_for_subnet(self, context, tenant_id,
+                                           subnet_id):
+        # confirm with neutron before removing, pools created while the
+        # index was loading are not counted
         pools = self._get_pools_on_subnet(context, tenant_id, subnet_id)
         if not pools:
             #No pools left on the old subnet.
             #We can remove the SNAT port/ipaddress
             self._remove_snatport_for_subnet(context, tenant_id, subnet_id)
+            # the subnet is commonly deleted right after its last pool
+            self.invalidate_subnet(subnet_id)
             msg = _("Removing SNAT port for subnet %s "
                     "as this is the last pool using it...") % subnet_id
             LOG.info(msg)
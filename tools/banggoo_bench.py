@@ -0,0 +1,478 @@
+#!/usr/bin/env python
+"""Throughput benchmark of the Banggoo LBaaS driver.
+
+Drives BanggooLoadBalancerDriver against a fake LBaaS plugin and core
+plugin, talking to the mock Control Center of banggoo_mock_server.py, and
+reports ops/sec and p50/p99 latency for create, update and delete of each
+resource type at several concurrency levels. Results are written as JSON
+so that runs of two driver versions can be compared:
+
+    python tools/banggoo_bench.py --ops 200 --output new.json \\
+        --baseline old.json --tolerance 0.2
+
+Driver options can be overridden with --set name=value, e.g.
+--set member_batch_window=0.02. Values are read like those of the
+[banggoo] section of neutron.conf. The fake plugins keep the objects in
+memory, so reconciliation, journal recovery, warm-up and cascading pool
+deletes work against them; the member status poller needs a database and
+is refused.
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+from oslo.config import cfg
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import banggoo_mock_server  # noqa
+
+from neutron.db.loadbalancer import loadbalancer_db  # noqa
+from neutron.extensions import loadbalancer  # noqa
+from neutron.services.loadbalancer.drivers.banggoo import bg_journal  # noqa
+from neutron.services.loadbalancer.drivers.banggoo import bg_reconcile  # noqa
+from neutron.services.loadbalancer.drivers.banggoo import driver  # noqa
+
+TENANT_ID = 'bench-tenant'
+SUBNET_ID = 'bench-subnet'
+NETWORK_ID = 'bench-network'
+CONCURRENCY = (1, 10, 100)
+
+
+def select(objects, filters=None):
+    """Return the objects matching neutron style list filters."""
+    filters = filters or {}
+    return [obj for obj in objects
+            if all(obj.get(key) in values
+                   for key, values in filters.items()
+                   if key in obj)]
+
+
+class FakeQuery(object):
+
+    """The bulk deletes of BanggooLoadBalancerDriver, on the fake plugin."""
+
+    def __init__(self, plugin, model):
+        self.plugin = plugin
+        self.model = model
+        self.filters = {}
+
+    def filter_by(self, **kwargs):
+        self.filters.update(kwargs)
+        return self
+
+    def delete(self, synchronize_session='evaluate'):
+        pool_id = self.filters['pool_id']
+        if self.model is loadbalancer_db.Member:
+            doomed = [member['id'] for member
+                      in self.plugin.members.values()
+                      if member['pool_id'] == pool_id]
+            for member_id in doomed:
+                del self.plugin.members[member_id]
+            return len(doomed)
+        pool = self.plugin.pools.get(pool_id, {})
+        count = len(pool.get('health_monitors_status', []))
+        pool['health_monitors_status'] = []
+        return count
+
+
+class FakeSession(object):
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+
+    @contextlib.contextmanager
+    def begin(self, subtransactions=False):
+        yield
+
+    def query(self, model):
+        return FakeQuery(self.plugin, model)
+
+
+class FakeContext(object):
+
+    def __init__(self, plugin, tenant_id=TENANT_ID):
+        self.tenant_id = tenant_id
+        self.user_id = 'bench-user'
+        self.is_admin = True
+        self.session = FakeSession(plugin)
+
+    def to_dict(self):
+        return {'tenant_id': self.tenant_id, 'user_id': self.user_id}
+
+
+class FakeContexts(object):
+
+    """Stands in for neutron.context in the driver modules.
+
+    The contexts the driver creates itself, for async operations and
+    background tasks, would otherwise open a database session.
+    """
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+        self.Context = self
+
+    def get_admin_context(self):
+        return FakeContext(self.plugin, tenant_id=None)
+
+    def from_dict(self, values):
+        return FakeContext(self.plugin, tenant_id=values['tenant_id'])
+
+
+class FakeCorePlugin(object):
+
+    def __init__(self):
+        self.ports = {}
+
+    def get_subnet(self, context, subnet_id):
+        return {'id': subnet_id, 'network_id': NETWORK_ID}
+
+    def get_subnets(self, context, filters=None, fields=None):
+        subnet_ids = (filters or {}).get('id', [SUBNET_ID])
+        return [self.get_subnet(context, subnet_id)
+                for subnet_id in subnet_ids]
+
+    def get_network(self, context, network_id):
+        return {'id': network_id, 'provider:network_type': 'vlan',
+                'provider:segmentation_id': 100}
+
+    def get_networks(self, context, filters=None, fields=None):
+        network_ids = (filters or {}).get('id', [NETWORK_ID])
+        return [self.get_network(context, network_id)
+                for network_id in network_ids]
+
+    def get_ports(self, context, filters=None):
+        return select(self.ports.values(), filters)
+
+    def create_port(self, context, port):
+        port = dict(port['port'], id=str(uuid.uuid4()))
+        port['fixed_ips'] = [{'subnet_id': SUBNET_ID,
+                              'ip_address': '10.0.0.2'}]
+        self.ports[port['id']] = port
+        return port
+
+    def delete_port(self, context, port_id):
+        self.ports.pop(port_id, None)
+
+
+class FakePlugin(object):
+
+    """Keeps LBaaS objects in memory instead of a database."""
+
+    def __init__(self):
+        self._core_plugin = FakeCorePlugin()
+        self.pools = {}
+        self.members = {}
+        self.vips = {}
+        self.monitors = {}
+        self.status_writes = 0
+
+    def _table(self, model):
+        if model is loadbalancer_db.Pool:
+            return self.pools
+        if model is loadbalancer_db.Member:
+            return self.members
+        return self.vips
+
+    def _association(self, hm_id, pool_id):
+        for hm_status in self.pools.get(pool_id, {}).get(
+                'health_monitors_status', []):
+            if hm_status['monitor_id'] == hm_id:
+                return hm_status
+        raise loadbalancer.PoolMonitorAssociationNotFound(monitor_id=hm_id,
+                                                          pool_id=pool_id)
+
+    def update_status(self, context, model, obj_id, status):
+        self.status_writes += 1
+        obj = self._table(model).get(obj_id)
+        if obj is not None:
+            obj['status'] = status
+
+    def update_pool_health_monitor(self, context, hm_id, pool_id, status,
+                                   description=None):
+        self.status_writes += 1
+        try:
+            self._association(hm_id, pool_id)['status'] = status
+        except loadbalancer.PoolMonitorAssociationNotFound:
+            pass
+
+    def get_pools(self, context, filters=None, fields=None):
+        return select(self.pools.values(), filters)
+
+    def get_pool(self, context, pool_id, fields=None):
+        if pool_id not in self.pools:
+            raise loadbalancer.PoolNotFound(pool_id=pool_id)
+        return self.pools[pool_id]
+
+    def get_members(self, context, filters=None, fields=None):
+        return select(self.members.values(), filters)
+
+    def get_member(self, context, member_id, fields=None):
+        if member_id not in self.members:
+            raise loadbalancer.MemberNotFound(member_id=member_id)
+        return self.members[member_id]
+
+    def get_vips(self, context, filters=None, fields=None):
+        return select(self.vips.values(), filters)
+
+    def get_vip(self, context, vip_id, fields=None):
+        if vip_id not in self.vips:
+            raise loadbalancer.VipNotFound(vip_id=vip_id)
+        return self.vips[vip_id]
+
+    def get_health_monitors(self, context, filters=None, fields=None):
+        return select(self.monitors.values(), filters)
+
+    def get_health_monitor(self, context, hm_id, fields=None):
+        if hm_id not in self.monitors:
+            raise loadbalancer.HealthMonitorNotFound(monitor_id=hm_id)
+        return self.monitors[hm_id]
+
+    def get_pool_health_monitor(self, context, hm_id, pool_id, fields=None):
+        return dict(self._association(hm_id, pool_id), pool_id=pool_id)
+
+    def _delete_db_vip(self, context, vip_id):
+        self.vips.pop(vip_id, None)
+
+    def _delete_db_pool(self, context, pool_id):
+        self.pools.pop(pool_id, None)
+
+    def _delete_db_member(self, context, member_id):
+        self.members.pop(member_id, None)
+
+    def _delete_db_pool_health_monitor(self, context, hm_id, pool_id):
+        pool = self.pools.get(pool_id, {})
+        pool['health_monitors_status'] = [
+            hm_status for hm_status in pool.get('health_monitors_status', [])
+            if hm_status['monitor_id'] != hm_id]
+
+
+def make_pool(pool_id):
+    return {'id': pool_id, 'tenant_id': TENANT_ID, 'vip_id': None,
+            'protocol': 'HTTP', 'subnet_id': SUBNET_ID, 'name': pool_id,
+            'description': '', 'lb_method': 'ROUND_ROBIN',
+            'admin_state_up': True, 'status': 'PENDING_CREATE',
+            'health_monitors_status': []}
+
+
+def make_member(member_id, pool_id, weight=1):
+    return {'id': member_id, 'tenant_id': TENANT_ID, 'pool_id': pool_id,
+            'address': '10.0.1.10', 'protocol_port': 80, 'weight': weight,
+            'admin_state_up': True, 'status': 'PENDING_CREATE'}
+
+
+def make_vip(vip_id, pool_id, connection_limit=-1):
+    return {'id': vip_id, 'tenant_id': TENANT_ID, 'pool_id': pool_id,
+            'protocol': 'HTTP', 'address': '10.0.0.100',
+            'protocol_port': 80, 'name': vip_id, 'description': '',
+            'connection_limit': connection_limit, 'admin_state_up': True,
+            'session_persistence': None, 'subnet_id': SUBNET_ID,
+            'port_id': 'vip-port-' + vip_id, 'status': 'PENDING_CREATE'}
+
+
+def make_monitor(hm_id, delay=5):
+    return {'id': hm_id, 'tenant_id': TENANT_ID, 'type': 'HTTP',
+            'delay': delay, 'timeout': 3, 'max_retries': 3,
+            'admin_state_up': True, 'http_method': 'GET', 'url_path': '/',
+            'expected_codes': '200'}
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run_phase(concurrency, calls):
+    """Run calls with the given concurrency and summarize the latencies."""
+    latencies = []
+    errors = [0]
+
+    def timed(call):
+        started = time.time()
+        try:
+            call()
+        except Exception:
+            errors[0] += 1
+        latencies.append(time.time() - started)
+
+    pool = eventlet.GreenPool(concurrency)
+    started = time.time()
+    for call in calls:
+        pool.spawn_n(timed, call)
+    pool.waitall()
+    elapsed = time.time() - started
+    return {'ops': len(calls),
+            'errors': errors[0],
+            'ops_per_sec': len(calls) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000}
+
+
+def bench_level(lb_driver, plugin, concurrency, ops):
+    """Create, update and delete ops objects of every resource type."""
+    context = FakeContext(plugin)
+    tag = uuid.uuid4().hex[:8]
+    pools = [make_pool('pool-%s-%d' % (tag, i)) for i in range(ops)]
+    members = [make_member('member-%s-%d' % (tag, i), pools[0]['id'])
+               for i in range(ops)]
+    vips = [make_vip('vip-%s-%d' % (tag, i), pools[i]['id'])
+            for i in range(ops)]
+    monitors = [make_monitor('hm-%s-%d' % (tag, i)) for i in range(ops)]
+    for pool in pools:
+        plugin.pools[pool['id']] = pool
+    for member in members:
+        plugin.members[member['id']] = member
+    for vip in vips:
+        plugin.vips[vip['id']] = vip
+    for hm in monitors:
+        plugin.monitors[hm['id']] = hm
+        pools[0]['health_monitors_status'].append(
+            {'monitor_id': hm['id'], 'status': 'PENDING_CREATE',
+             'status_description': None})
+
+    def call(func, *args):
+        return lambda: func(context, *args)
+
+    phases = [
+        ('pool', 'create', [call(lb_driver.create_pool, p) for p in pools]),
+        ('member', 'create',
+         [call(lb_driver.create_member, m) for m in members]),
+        ('vip', 'create', [call(lb_driver.create_vip, v) for v in vips]),
+        ('healthmonitor', 'create',
+         [call(lb_driver.create_pool_health_monitor, hm, pools[0]['id'])
+          for hm in monitors]),
+        ('pool', 'update',
+         [call(lb_driver.update_pool, p, dict(p, lb_method='LEAST_CONNECTIONS'))
+          for p in pools]),
+        ('member', 'update',
+         [call(lb_driver.update_member, m, dict(m, weight=5))
+          for m in members]),
+        ('vip', 'update',
+         [call(lb_driver.update_vip, v, dict(v, connection_limit=1000))
+          for v in vips]),
+        ('healthmonitor', 'update',
+         [call(lb_driver.update_pool_health_monitor, hm,
+               make_monitor(hm['id'], delay=10), pools[0]['id'])
+          for hm in monitors]),
+        ('healthmonitor', 'delete',
+         [call(lb_driver.delete_pool_health_monitor, hm, pools[0]['id'])
+          for hm in monitors]),
+        ('vip', 'delete', [call(lb_driver.delete_vip, v) for v in vips]),
+        ('member', 'delete',
+         [call(lb_driver.delete_member, m) for m in members]),
+        ('pool', 'delete', [call(lb_driver.delete_pool, p) for p in pools]),
+    ]
+    results = {}
+    for resource, operation, calls in phases:
+        result = run_phase(concurrency, calls)
+        if lb_driver.workers is not None:
+            lb_driver.workers.waitall()
+        results['%s.%s' % (resource, operation)] = result
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return the benchmarks whose throughput fell below the baseline."""
+    regressions = []
+    for level, benches in results['results'].items():
+        for name, result in benches.items():
+            old = baseline.get('results', {}).get(level, {}).get(name)
+            if not old or not old['ops_per_sec']:
+                continue
+            ratio = result['ops_per_sec'] / old['ops_per_sec']
+            if ratio < 1.0 - tolerance:
+                regressions.append({'concurrency': level, 'benchmark': name,
+                                    'ops_per_sec': result['ops_per_sec'],
+                                    'baseline_ops_per_sec':
+                                    old['ops_per_sec']})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ops', type=int, default=200,
+                        help='objects per resource type and level')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=list(CONCURRENCY))
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='mock device delay per request in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--payload-size', type=int, default=0)
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='NAME=VALUE',
+                        help='override a [banggoo] driver option')
+    parser.add_argument('--output', help='write the JSON results here')
+    parser.add_argument('--baseline', help='JSON results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative throughput loss')
+    args = parser.parse_args()
+
+    option_names = set(opt.dest for opt in driver.driver_opts)
+    lines = ['[banggoo]']
+    for override in args.set:
+        name, _sep, value = override.partition('=')
+        if name not in option_names:
+            parser.error('unknown [banggoo] option %s' % name)
+        lines.append('%s = %s' % (name, value))
+    # a config file gets the values converted to the type of each option
+    fd, conf_file = tempfile.mkstemp(suffix='.conf')
+    with os.fdopen(fd, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    try:
+        cfg.CONF(['--config-file', conf_file], project='neutron')
+    finally:
+        os.unlink(conf_file)
+    if cfg.CONF.banggoo.member_status_interval > 0:
+        parser.error('member_status_interval needs a neutron database')
+
+    server, uri, device = banggoo_mock_server.serve(
+        latency=args.latency / 1000.0, error_rate=args.error_rate,
+        payload_size=args.payload_size)
+    cfg.CONF.set_override('adc_address', uri, 'banggoo')
+    cfg.CONF.set_override('adc_addresses', [], 'banggoo')
+
+    plugin = FakePlugin()
+    contexts = FakeContexts(plugin)
+    for module in (driver, bg_journal, bg_reconcile):
+        module.n_context = contexts
+    lb_driver = driver.BanggooLoadBalancerDriver(plugin)
+    results = {'timestamp': time.time(),
+               'ops': args.ops,
+               'mock': {'latency_ms': args.latency,
+                        'error_rate': args.error_rate,
+                        'payload_size': args.payload_size},
+               'overrides': args.set,
+               'results': {}}
+    for concurrency in args.concurrency:
+        results['results'][str(concurrency)] = bench_level(
+            lb_driver, plugin, concurrency, args.ops)
+    results['device_requests'] = device.requests
+    server.shutdown()
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        results['regressions'] = regressions
+        status = 1 if regressions else 0
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
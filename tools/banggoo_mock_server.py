@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+"""Local stand-in for the Banggoo Control Center REST API.
+
+Serves the vips/, pools/, members/, pools/<id>/healthmonitors and
+statistics/ resources the driver talks to, keeping everything in memory.
+Compressed request bodies are accepted and replies of 1 KiB or more are
+gzipped for clients that accept it.
+Latency, error rate and response payload size can be tuned to simulate a
+slow or flaky appliance:
+
+    python tools/banggoo_mock_server.py --port 4488 --latency 20 \\
+        --error-rate 0.01 --payload-size 4096
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+
+KINDS = ('vips', 'pools', 'members', 'healthmonitors')
+STATS_FIELDS = ('bytes_in', 'bytes_out', 'active_connections',
+                'total_connections')
+GZIP_THRESHOLD = 1024
+
+
+class ControlCenter(object):
+
+    """In-memory inventory of the simulated device."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0,
+                 payload_size=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.payload_size = payload_size
+        self.lock = threading.Lock()
+        self.objects = dict((kind, {}) for kind in KINDS)
+        self.requests = 0
+
+    def delay(self):
+        seconds = self.latency + random.uniform(0, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def fail(self):
+        return self.error_rate and random.random() < self.error_rate
+
+    def padding(self):
+        return 'x' * self.payload_size if self.payload_size else None
+
+    def statistics(self, pool_id):
+        stats = dict((field, random.randint(0, 1 << 20))
+                     for field in STATS_FIELDS)
+        stats['pool_id'] = pool_id
+        if self.payload_size:
+            stats['padding'] = self.padding()
+        return stats
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    device = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def _reply(self, status, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if (len(data) >= GZIP_THRESHOLD and
+                'gzip' in self.headers.get('Accept-Encoding', '')):
+            compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            data = compressor.compress(data) + compressor.flush()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        data = self.rfile.read(length)
+        encoding = self.headers.get('Content-Encoding')
+        if encoding == 'gzip':
+            data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            data = zlib.decompress(data)
+        return json.loads(data.decode('utf-8'))
+
+    def _handle(self, method):
+        device = self.device
+        body = self._body()
+        with device.lock:
+            device.requests += 1
+        device.delay()
+        if device.fail():
+            return self._reply(500, {'error': 'simulated failure'})
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        tenant_id = self.headers.get('X-Tenant-ID')
+        try:
+            status, reply = self._route(method, parts, body, tenant_id)
+        except (KeyError, IndexError, ValueError):
+            status, reply = 400, {'error': 'bad request'}
+        self._reply(status, reply)
+
+    def _route(self, method, parts, body, tenant_id):
+        device = self.device
+        objects = device.objects
+        if parts[0] == 'login' and method == 'POST':
+            return 200, {'login': {'token': '%032x' % random.getrandbits(128),
+                                   'expires_in': 3600}}
+        if parts[0] == 'statistics':
+            if len(parts) > 1:
+                return 200, device.statistics(parts[1])
+            with device.lock:
+                pools = [pool for pool in objects['pools'].values()
+                         if tenant_id in (None, pool.get('tenant_id'))]
+            return 200, {'statistics': [device.statistics(pool['id'])
+                                        for pool in pools]}
+        if (len(parts) >= 3 and parts[0] == 'pools' and
+                parts[2] == 'healthmonitors'):
+            # pools/<pool_id>/healthmonitors[/<id>]
+            pool_id = parts[1]
+            if method == 'POST':
+                monitor = dict(body['healthmonitor'], pool_id=pool_id)
+                with device.lock:
+                    objects['healthmonitors'][(monitor['id'],
+                                               pool_id)] = monitor
+                return 201, {'healthmonitor': monitor}
+            if method == 'DELETE':
+                with device.lock:
+                    objects['healthmonitors'].pop((parts[3], pool_id), None)
+                return 200, None
+        kind = parts[0]
+        if kind not in objects:
+            return 404, {'error': 'unknown resource'}
+        store = objects[kind]
+        if len(parts) == 1:
+            if method == 'GET':
+                with device.lock:
+                    items = [item for item in store.values()
+                             if tenant_id in (None, item.get('tenant_id'))]
+                return 200, {kind: items}
+            if method == 'POST':
+                obj = list(body.values())[0]
+                with device.lock:
+                    store[obj['id']] = obj
+                return 201, body
+        elif kind == 'members' and parts[1] == 'status' and method == 'GET':
+            with device.lock:
+                return 200, {kind: [{'id': obj_id, 'status': 'UP'}
+                                    for obj_id in store]}
+        elif parts[1] == 'bulk' and method == 'POST':
+            results = []
+            with device.lock:
+                for obj in body[kind]:
+                    store[obj['id']] = obj
+                    results.append({'id': obj['id'], 'status': 201})
+            return 200, {'results': results}
+        elif parts[1] == 'bulk_delete' and method == 'POST':
+            with device.lock:
+                for obj_id in body['ids']:
+                    store.pop(obj_id, None)
+            return 200, {'results': [{'id': obj_id, 'status': 200}
+                                     for obj_id in body['ids']]}
+        else:
+            obj_id = parts[1]
+            with device.lock:
+                if kind == 'healthmonitors':
+                    keys = [key for key in store if key[0] == obj_id]
+                else:
+                    keys = [obj_id] if obj_id in store else []
+                if not keys:
+                    return 404, {'error': 'not found'}
+                if method == 'GET':
+                    return 200, store[keys[0]]
+                if method == 'PUT':
+                    for key in keys:
+                        store[key].update(list(body.values())[0])
+                    return 200, store[keys[0]]
+                if method == 'DELETE':
+                    for key in keys:
+                        del store[key]
+                    if kind == 'pools' and 'cascade=true' in self.path:
+                        for child in ('members', 'healthmonitors'):
+                            children = objects[child]
+                            for key in list(children):
+                                if children[key].get('pool_id') == obj_id:
+                                    del children[key]
+                    return 200, None
+        return 405, {'error': 'method not allowed'}
+
+
+class ThreadingServer(socketserver.ThreadingMixIn,
+                      BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+
+def serve(host='127.0.0.1', port=0, **options):
+    """Start a mock Control Center in a background thread.
+
+    Returns the server, its URI and the ControlCenter holding the state.
+    """
+    device = ControlCenter(**options)
+    handler = type('BoundHandler', (Handler,), {'device': device})
+    server = ThreadingServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    uri = 'http://%s:%d/' % server.server_address
+    return server, uri, device
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4488)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='fixed delay per request in milliseconds')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='random extra delay in milliseconds')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests answered with a 500')
+    parser.add_argument('--payload-size', type=int, default=0,
+                        help='bytes of padding added to statistics replies')
+    args = parser.parse_args()
+    server, uri, _device = serve(args.host, args.port,
+                                 latency=args.latency / 1000.0,
+                                 jitter=args.jitter / 1000.0,
+                                 error_rate=args.error_rate,
+                                 payload_size=args.payload_size)
+    print('Mock Banggoo Control Center listening on %s' % uri)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()